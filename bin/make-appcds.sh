@@ -0,0 +1,89 @@
+#!/bin/bash
+
+# Generate a dynamic AppCDS (class data sharing) archive for this exact
+# Bamboo version and JDK, by booting Bamboo once up to the setup wizard and
+# archiving the classes that were loaded on the way. The entrypoint passes the
+# archive to the JVM via -XX:SharedArchiveFile when the JDK still matches the
+# recorded fingerprint.
+#
+# This is a best-effort optimisation: any failure leaves no archive behind and
+# does not fail the image build.
+
+: ${BAMBOO_INSTALL_DIR:?}
+: ${BAMBOO_HOME:?}
+: ${RUN_USER:?}
+: ${APPCDS_TRAINING_TIMEOUT:=600}
+
+ARCHIVE_DIR="${BAMBOO_INSTALL_DIR}/appcds"
+ARCHIVE="${ARCHIVE_DIR}/bamboo.jsa"
+STATUS_URL="http://localhost:8085/status"
+
+# Dynamic archives need JDK 13+
+JAVA_MAJOR_VERSION=$(. "${JAVA_HOME}/release" && echo "${JAVA_VERSION}" | cut -d. -f1)
+if [[ "${JAVA_MAJOR_VERSION}" -lt 13 ]]; then
+    echo "JDK ${JAVA_MAJOR_VERSION} does not support dynamic AppCDS archives; skipping"
+    exit 0
+fi
+
+# Stop the training JVM, giving it time to write the archive on exit
+stop_training() {
+    [[ -n "${TRAINING_PID}" ]] || return 0
+    local jvm_pid
+    # The build environment may hold other *_INSTALL_DIR variables, so do not let common.sh guess the app
+    jvm_pid=$(APP_NAME=BAMBOO; source /opt/atlassian/support/common.sh 2> /dev/null && echo "${JVM_APP_PID}")
+    if [[ -n "${jvm_pid}" ]]; then
+        kill -TERM ${jvm_pid} 2> /dev/null
+        for (( i = 0; i < 120; i++ )); do
+            kill -0 ${jvm_pid} 2> /dev/null || break
+            sleep 1
+        done
+        kill -KILL ${jvm_pid} 2> /dev/null
+    fi
+    kill ${TRAINING_PID} 2> /dev/null
+    wait ${TRAINING_PID}
+    TRAINING_PID=""
+}
+
+# Remove everything the training run left behind, however the script exits
+cleanup() {
+    stop_training
+    rm -rf "${BAMBOO_HOME:?}"/* "${BAMBOO_HOME}"/.[!.]* \
+           "${BAMBOO_INSTALL_DIR}"/logs/* "${BAMBOO_INSTALL_DIR}"/temp/* "${BAMBOO_INSTALL_DIR}"/work/* \
+           /tmp/hsperfdata_* /tmp/.bamboo-jvm.pid
+    exit 0
+}
+trap cleanup EXIT
+
+fail() {
+    echo "AppCDS training run failed: $1; continuing without an archive"
+    rm -rf "${ARCHIVE_DIR}"
+    exit 0
+}
+
+mkdir -p "${ARCHIVE_DIR}" && chown "${RUN_USER}" "${ARCHIVE_DIR}" || fail "could not create ${ARCHIVE_DIR}"
+
+echo "Starting Bamboo for AppCDS training run"
+START=$(date +%s)
+su "${RUN_USER}" -c "JVM_SUPPORT_RECOMMENDED_ARGS='-XX:ArchiveClassesAtExit=${ARCHIVE}' ${BAMBOO_INSTALL_DIR}/bin/start-bamboo.sh -fg" &
+TRAINING_PID=$!
+
+READY=false
+while [[ $(( $(date +%s) - START )) -lt ${APPCDS_TRAINING_TIMEOUT} ]] && kill -0 ${TRAINING_PID} 2> /dev/null; do
+    if curl -fs "${STATUS_URL}" | grep -q '"state"'; then
+        READY=true
+        break
+    fi
+    sleep 2
+done
+echo "Training run ready=${READY} after $(( $(date +%s) - START ))s"
+
+# The archive is written when the JVM exits normally
+stop_training
+
+[[ "${READY}" == "true" ]] || fail "Bamboo did not start"
+[[ -s "${ARCHIVE}" ]] || fail "no archive was written"
+sha256sum < "${JAVA_HOME}/release" | cut -d' ' -f1 > "${ARCHIVE}.fingerprint" \
+    && chmod -R 550 "${ARCHIVE_DIR}" \
+    && chown -R "${RUN_USER}:root" "${ARCHIVE_DIR}" \
+    || fail "could not install the archive"
+echo "AppCDS archive written to ${ARCHIVE} ($(du -h ${ARCHIVE} | cut -f1))"
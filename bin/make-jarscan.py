@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Determine which of Bamboo's jars Tomcat can skip when it scans the web application
+# at startup, and record them for the entrypoint, which renders them into the
+# JarScanFilter of the context in server.xml:
+#
+#   tldSkip           Jars without tag library descriptors (META-INF/**.tld).
+#   pluggabilitySkip  Jars without web fragments, ServletContainerInitializers or
+#                     static resources, and without any class that refers to the
+#                     servlet API, which servlet annotations and @HandlesTypes
+#                     targets need to.
+#
+# This is a best-effort optimisation: any failure leaves no list behind and does not
+# fail the image build.
+
+import json
+import os
+import sys
+import zipfile
+
+PLUGGABILITY_ENTRIES = (
+    'META-INF/web-fragment.xml',
+    'META-INF/services/javax.servlet.ServletContainerInitializer',
+    'META-INF/services/jakarta.servlet.ServletContainerInitializer',
+)
+SERVLET_PACKAGES = (b'javax/servlet/', b'jakarta/servlet/')
+
+
+def scan_jar(path):
+    """
+    Returns:
+    - tuple: (whether the jar contains TLDs, whether it is relevant to pluggability scanning)
+    """
+    with zipfile.ZipFile(path) as jar:
+        names = jar.namelist()
+        has_tld = any(n.startswith('META-INF/') and n.endswith('.tld') for n in names)
+        if any(n in PLUGGABILITY_ENTRIES or n.startswith('META-INF/resources/') for n in names):
+            return has_tld, True
+        for name in names:
+            if name.endswith('.class'):
+                data = jar.read(name)
+                if any(p in data for p in SERVLET_PACKAGES):
+                    return has_tld, True
+        return has_tld, False
+
+
+def make_skip_lists(lib_dir):
+    tld_skip = []
+    pluggability_skip = []
+    for name in sorted(os.listdir(lib_dir)):
+        if not name.endswith('.jar'):
+            continue
+        has_tld, pluggable = scan_jar(os.path.join(lib_dir, name))
+        if not has_tld:
+            tld_skip.append(name)
+        if not pluggable:
+            pluggability_skip.append(name)
+    return {'tldSkip': tld_skip, 'pluggabilitySkip': pluggability_skip}
+
+
+def main():
+    install_dir = os.environ['BAMBOO_INSTALL_DIR']
+    lib_dir = f'{install_dir}/atlassian-bamboo/WEB-INF/lib'
+    output = f'{install_dir}/conf/jarscan.json'
+    try:
+        skip = make_skip_lists(lib_dir)
+        with open(output, 'w', encoding='utf-8') as fd:
+            json.dump(skip, fd, indent=2)
+        os.chmod(output, 0o444)
+    except Exception as e:
+        # Any failure, e.g. a malformed jar, only costs the optimisation
+        print(f'Could not generate the jar scan skip lists: {e!r}; continuing without them')
+        if os.path.exists(output):
+            os.remove(output)
+        return 0
+    jars = len([n for n in os.listdir(lib_dir) if n.endswith('.jar')])
+    print(f"Jar scanning: {len(skip['tldSkip'])} of {jars} jars skipped for TLDs, "
+          f"{len(skip['pluggabilitySkip'])} for pluggability; written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,16 @@
 #!/usr/bin/python3
 
+import hashlib
+import json
+import logging
 import os
+import shlex
+import subprocess
+import sys
 import xml.etree.ElementTree as ET
 
-from entrypoint_helpers import env, gen_cfg, str2bool, str2bool_or, exec_app
+from entrypoint_helpers import env, gen_cfg, link_scratch_dir, make_dir, str2bool, str2bool_or, \
+    unlink_dangling_dir, unset_secure_vars, exec_app
 
 RUN_USER = env['run_user']
 RUN_GROUP = env['run_group']
@@ -15,6 +22,31 @@ ATL_BAMBOO_ENABLE_UNATTENDED_SETUP = str2bool(env.get('atl_bamboo_enable_unatten
 ATL_BAMBOO_DISABLE_AGENT_AUTH = str2bool(env.get('atl_bamboo_disable_agent_auth'))
 UPDATE_CFG = str2bool_or(env.get('atl_force_cfg_update'), False)
 BUILD_NUMBER = env.get('build_number')
+ATL_GC_LOG = str2bool(env.get('atl_gc_log'))
+ATL_JFR_MODE = env.get('atl_jfr_mode', 'off').lower()
+ATL_APPCDS = str2bool_or(env.get('atl_appcds'), True)
+APPCDS_ARCHIVE = f'{BAMBOO_INSTALL_DIR}/appcds/bamboo.jsa'
+ATL_SCRATCH_DIR = env.get('atl_scratch_dir')
+ATL_SCRATCH_HOME_DIRS = [d.strip() for d in env.get('atl_scratch_home_dirs', 'temp,local-working-dir,caches').split(',')
+                         if d.strip()]
+ATL_JDBC_URL = env.get('atl_jdbc_url')
+ATL_DB_WAIT = str2bool(env.get('atl_db_wait'))
+ATL_DB_WAIT_DEADLINE = env.get('atl_db_wait_deadline', '120')
+WAIT_READY = '/opt/atlassian/support/wait_ready.py'
+ATL_WATCHDOG_ARGS = env.get('atl_watchdog_args')
+WATCHDOG = '/opt/atlassian/support/watchdog.py'
+ATL_METRICS_PORT = env.get('atl_metrics_port')
+JMX_EXPORTER_JAR = '/opt/atlassian/jmx/jmx_prometheus_javaagent.jar'
+ATL_TOMCAT_JARSCAN_FILTER = str2bool_or(env.get('atl_tomcat_jarscan_filter'), True)
+JARSCAN_SKIP_LISTS = f'{BAMBOO_INSTALL_DIR}/conf/jarscan.json'
+
+# If ATL_DB_WAIT is set, wait for the database server in the background while the configuration is
+# generated, so that Bamboo is not started against a database that is still coming up. Startup is
+# held for at most ATL_DB_WAIT_DEADLINE seconds when the database stays unreachable.
+db_wait = None
+if ATL_DB_WAIT and ATL_JDBC_URL:
+    db_wait = subprocess.Popen([sys.executable, WAIT_READY, '--jdbc', '--deadline', ATL_DB_WAIT_DEADLINE],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
 # Set BUILD_NUMBER from the pom.xml if not already available in the environment variables
 if BUILD_NUMBER is None:
@@ -28,6 +60,59 @@ if BUILD_NUMBER is None:
 def add_jvm_arg(arg):
     os.environ['JVM_SUPPORT_RECOMMENDED_ARGS'] = os.environ.get('JVM_SUPPORT_RECOMMENDED_ARGS', '') + ' ' + arg
 
+def wait_for_db(proc):
+    stdout, stderr = proc.communicate()
+    try:
+        report = json.loads(stdout)
+    except ValueError:
+        error = stderr.strip().splitlines()[-1] if stderr.strip() else f'exit code {proc.returncode}'
+        logging.warning('Database readiness check failed: %s', error)
+        return
+    if not report['targets']:
+        logging.info('The JDBC URL does not refer to a database server; not waiting for it')
+    elif report['ready']:
+        logging.info('Database %s ready after %.3fs', report['targets'][0]['name'], report['elapsed'])
+    else:
+        target = report['targets'][0]
+        logging.warning('Database %s not ready after %.3fs (%s attempts, last error: %s); starting Bamboo anyway',
+                        target['name'], report['elapsed'], target['attempts'], target['error'])
+
+def appcds_archive_matches_jdk(archive):
+    # The archive is only usable by the exact JDK build that created it
+    try:
+        with open(f'{archive}.fingerprint', encoding='utf-8') as fd:
+            archive_fingerprint = fd.read().strip()
+        with open(f"{env['java_home']}/release", 'rb') as fd:
+            jdk_fingerprint = hashlib.sha256(fd.read()).hexdigest()
+    except (OSError, KeyError):
+        return False
+    return archive_fingerprint == jdk_fingerprint
+
+# Relocate high-churn, non-durable directories to node-local scratch storage (e.g. an
+# emptyDir or tmpfs volume mounted at ATL_SCRATCH_DIR). Tomcat's temp and work directories
+# are pointed there directly; the listed BAMBOO_HOME subdirectories are replaced with
+# symlinks, which is only done where no data would be hidden.
+if ATL_SCRATCH_DIR:
+    make_dir(ATL_SCRATCH_DIR, RUN_USER, RUN_GROUP, 0o750)
+    for tomcat_dir in ('temp', 'work'):
+        make_dir(f'{ATL_SCRATCH_DIR}/tomcat-{tomcat_dir}', RUN_USER, RUN_GROUP, 0o750)
+    os.environ['CATALINA_TMPDIR'] = f'{ATL_SCRATCH_DIR}/tomcat-temp'
+    env['atl_tomcat_workdir'] = f'{ATL_SCRATCH_DIR}/tomcat-work'
+    for home_dir in ATL_SCRATCH_HOME_DIRS:
+        link_scratch_dir(f'{BAMBOO_HOME}/{home_dir}', f'{ATL_SCRATCH_DIR}/home/{home_dir}', RUN_USER, RUN_GROUP)
+else:
+    # Scratch storage may have been disabled since the last start
+    for home_dir in ATL_SCRATCH_HOME_DIRS:
+        unlink_dangling_dir(f'{BAMBOO_HOME}/{home_dir}')
+
+# Jars that Tomcat need not scan for TLDs and web fragments, determined at image build time by
+# bin/make-jarscan.py
+if ATL_TOMCAT_JARSCAN_FILTER and os.path.exists(JARSCAN_SKIP_LISTS):
+    with open(JARSCAN_SKIP_LISTS, encoding='utf-8') as fd:
+        jarscan = json.load(fd)
+    env['atl_tomcat_jarscan_tldskip'] = ','.join(jarscan['tldSkip'])
+    env['atl_tomcat_jarscan_pluggabilityskip'] = ','.join(jarscan['pluggabilitySkip'])
+
 gen_cfg('server.xml.j2', f'{BAMBOO_INSTALL_DIR}/conf/server.xml')
 gen_cfg('seraph-config.xml.j2',
         f'{BAMBOO_INSTALL_DIR}/atlassian-bamboo/WEB-INF/classes/seraph-config.xml')
@@ -63,6 +148,51 @@ if ATL_BAMBOO_ENABLE_UNATTENDED_SETUP:
 if ATL_BAMBOO_DISABLE_AGENT_AUTH:
     add_jvm_arg('-Dbamboo.setup.remote.agent.authentication.enabled=false')
 
+# Class data sharing archive generated at image build time by bin/make-appcds.sh. If the
+# JVM rejects it anyway (e.g. due to incompatible heap settings) it falls back silently.
+if ATL_APPCDS and appcds_archive_matches_jdk(APPCDS_ARCHIVE):
+    add_jvm_arg(f'-XX:SharedArchiveFile={APPCDS_ARCHIVE} -Xshare:auto -Xlog:cds=off,cds+dynamic=off')
+
+# Rotated unified GC and safepoint logging. Summarise with /opt/atlassian/support/gc_stats.py
+if ATL_GC_LOG:
+    gc_log_filecount = env.get('atl_gc_log_filecount', '10')
+    gc_log_filesize = env.get('atl_gc_log_filesize', '20M')
+    add_jvm_arg(f"-Xlog:gc*,safepoint:file={BAMBOO_INSTALL_DIR}/logs/gc.log:time,uptime,level,tags"
+                f":filecount={gc_log_filecount},filesize={gc_log_filesize}")
+
+# Prometheus metrics for the database connection pool, HTTP connectors, embedded broker and the
+# JVM, served by the JMX exporter agent on ATL_METRICS_PORT
+if ATL_METRICS_PORT:
+    metrics_config = f'{BAMBOO_HOME}/jmx-exporter.yml'
+    gen_cfg('jmx-exporter.yml.j2', metrics_config, user=RUN_USER, group=RUN_GROUP)
+    add_jvm_arg(f'-javaagent:{JMX_EXPORTER_JAR}={ATL_METRICS_PORT}:{metrics_config}')
+
+# Always-on Java Flight Recorder ring buffer. 'continuous' uses the low-overhead default
+# settings, 'profile' adds method profiling. Snapshot with /opt/atlassian/support/jfr-dump.sh
+if ATL_JFR_MODE in ('continuous', 'profile'):
+    jfr_dir = env.get('atl_jfr_dir', f'{BAMBOO_INSTALL_DIR}/logs/jfr')
+    jfr_settings = 'default' if ATL_JFR_MODE == 'continuous' else 'profile'
+    make_dir(jfr_dir, RUN_USER, RUN_GROUP, 0o750)
+    add_jvm_arg(f"-XX:FlightRecorderOptions=repository={jfr_dir}")
+    add_jvm_arg(f"-XX:StartFlightRecording=name=atlassian,settings={jfr_settings},disk=true"
+                f",maxage={env.get('atl_jfr_maxage', '6h')},maxsize={env.get('atl_jfr_maxsize', '250m')}"
+                f",dumponexit=true,filename={jfr_dir}/exit.jfr")
+elif ATL_JFR_MODE != 'off':
+    logging.warning("Unknown ATL_JFR_MODE '%s'; flight recording disabled", ATL_JFR_MODE)
+
+if db_wait is not None:
+    wait_for_db(db_wait)
+
+# Optional resource watchdog that captures diagnostics into BAMBOO_HOME/diagnostics when thresholds
+# are breached, e.g. ATL_WATCHDOG_ARGS='--cpu 300 --gc 25 --action threads --action jfr'. It is
+# started as the run user, without the sensitive environment, and orphaned so that the JVM does
+# not inherit it as a child once we exec.
+if ATL_WATCHDOG_ARGS:
+    unset_secure_vars()
+    run_as = {'user': RUN_USER, 'group': RUN_GROUP, 'extra_groups': []} if os.getuid() == 0 else {}
+    subprocess.run(['/bin/sh', '-c', '"$@" &', 'watchdog', sys.executable, WATCHDOG] + shlex.split(ATL_WATCHDOG_ARGS),
+                   cwd='/', check=True, **run_as)
+
 # Go
 exec_app([f'{BAMBOO_INSTALL_DIR}/bin/start-bamboo.sh', '-fg'], BAMBOO_HOME,
          name='Bamboo', env_cleanup=True)
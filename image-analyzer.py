@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+
+##############################################################################
+#
+# Offline size analysis of a `docker save` tarball. The archive and its
+# layers are streamed, so images of any size can be analysed without
+# extracting them or talking to a Docker daemon:
+#
+#     docker save atlassian/bamboo:9.6.5 -o bamboo.tar
+#     python image-analyzer.py bamboo.tar
+#
+# Reports the size added by each Dockerfile instruction, the size of the
+# well-known parts of the image (Maven, git, the Bamboo install, package
+# manager leftovers, ...) and of the largest directories, and the bytes
+# wasted by files that are duplicated, overwritten or deleted across layers.
+# Pass a second tarball to compare two images, e.g. two Bamboo versions:
+#
+#     python image-analyzer.py bamboo-9.6.4.tar bamboo-9.6.5.tar
+#
+# Layers may be uncompressed, gzip- or zstd-compressed. zstd layers need the
+# `zstandard` Python module or the `zstd` command.
+#
+##############################################################################
+
+import argparse
+import contextlib
+import hashlib
+import json
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+from collections import defaultdict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WHITEOUT_PREFIX = '.wh.'
+OPAQUE_WHITEOUT = '.wh..wh..opq'
+
+# Well-known parts of the image, as path prefixes relative to the root. Entries may refer to the image's
+# environment variables, which are resolved from the image config.
+CATEGORIES = [
+    ('maven', ['${MAVEN_HOME}/']),
+    ('git', ['usr/bin/git', 'bin/git', 'libexec/git-core/', 'usr/libexec/git-core/', 'share/git-core/',
+             'usr/share/git-core/', 'usr/share/perl5/Git', 'usr/share/gitweb/']),
+    ('bamboo', ['${BAMBOO_INSTALL_DIR}/']),
+    ('atlassian-agent', ['${AGENT_PATH}/']),
+    ('jdk', ['${JAVA_HOME}/']),
+    ('apt-leftovers', ['var/lib/apt/lists/', 'var/cache/apt/', 'var/cache/debconf/', 'var/log/apt/',
+                       'var/log/dpkg.log', 'usr/share/doc/', 'usr/share/man/']),
+    ('dnf-leftovers', ['var/cache/dnf/', 'var/cache/yum/', 'var/lib/dnf/', 'var/log/dnf', 'var/log/hawkey.log']),
+    ('python', ['usr/lib/python3', 'usr/lib64/python3']),
+]
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+TAR_MAGIC_OFFSET = 257
+
+
+class PrefixedReader:
+    """
+    A file-like object that replays bytes that were already read from a stream before the rest of it.
+    """
+    def __init__(self, head, fileobj):
+        self.head = head
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.fileobj.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.fileobj.read(), b''
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+@contextlib.contextmanager
+def zstd_reader(fileobj):
+    """
+    Decompress a zstd stream, with the `zstandard` module if it is installed or the `zstd` command otherwise.
+    """
+    if zstandard is not None:
+        with zstandard.ZstdDecompressor().stream_reader(fileobj) as reader:
+            yield reader
+        return
+    if shutil.which('zstd') is None:
+        raise ValueError('zstd-compressed layers need the zstandard module or the zstd command')
+
+    proc = subprocess.Popen(['zstd', '-dc'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in iter(lambda: fileobj.read(1 << 20), b''):
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            # The layer has been read to its end-of-archive marker
+            pass
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        proc.wait()
+
+
+class LiveFiles:
+    """
+    The regular files visible in the filesystem built up so far, indexed by directory so that whiteouts only
+    visit the files they delete.
+    """
+    def __init__(self):
+        self.files = {}                     # path -> (layer index, size, digest)
+        self.children = defaultdict(set)    # directory -> paths of its direct children
+
+    def add(self, path, value):
+        """
+        Returns:
+        - tuple: The value of the file that was overwritten, or None.
+        """
+        previous = self.files.get(path)
+        self.files[path] = value
+        child = path
+        while child:
+            parent = child.rpartition('/')[0]
+            if child in self.children[parent]:
+                break
+            self.children[parent].add(child)
+            child = parent
+        return previous
+
+    def delete(self, path, contents_only=False):
+        """
+        Delete a file or a directory tree, or just the contents of a directory.
+        Returns:
+        - int: The total size of the deleted files.
+        """
+        size = 0
+        pending = list(self.children.pop(path, ()))
+        if not contents_only:
+            self.children[path.rpartition('/')[0]].discard(path)
+            pending.append(path)
+        while pending:
+            p = pending.pop()
+            if p in self.files:
+                size += self.files.pop(p)[1]
+            pending.extend(self.children.pop(p, ()))
+        return size
+
+
+def normalize(path):
+    while path.startswith('./') or path.startswith('/'):
+        path = path[2:] if path.startswith('./') else path[1:]
+    return path
+
+
+def scan_layer(fileobj, hash_min_size):
+    """
+    Stream a layer tar and record its regular files and whiteouts.
+    Returns:
+    - dict: 'files' maps path -> (size, sha256 or None); 'whiteouts' is a list of deleted paths (with a trailing
+      '/' for opaque directories).
+    """
+    files = {}
+    whiteouts = []
+    with tarfile.open(fileobj=fileobj, mode='r|*') as layer:
+        for member in layer:
+            path = normalize(member.name)
+            dirname, _, basename = path.rpartition('/')
+            if basename == OPAQUE_WHITEOUT:
+                whiteouts.append(f'{dirname}/')
+            elif basename.startswith(WHITEOUT_PREFIX):
+                whiteouts.append(f'{dirname}/{basename[len(WHITEOUT_PREFIX):]}'.lstrip('/'))
+            elif member.isfile():
+                digest = None
+                if member.size >= hash_min_size:
+                    sha = hashlib.sha256()
+                    data = layer.extractfile(member)
+                    for chunk in iter(lambda: data.read(1 << 20), b''):
+                        sha.update(chunk)
+                    digest = sha.hexdigest()
+                files[path] = (member.size, digest)
+    return {'files': files, 'whiteouts': whiteouts}
+
+
+def read_archive(path, hash_min_size):
+    """
+    Stream a `docker save` archive (legacy or OCI layout), scanning every layer it contains.
+    Returns:
+    - tuple: (manifest, {member name: parsed JSON}, {member name: scanned layer})
+    """
+    documents = {}
+    layers = {}
+    with tarfile.open(path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            fileobj = archive.extractfile(member)
+            head = fileobj.read(TAR_MAGIC_OFFSET + 5)
+            if head.startswith(ZSTD_MAGIC):
+                with zstd_reader(PrefixedReader(head, fileobj)) as reader:
+                    layers[member.name] = scan_layer(reader, hash_min_size)
+            elif head.startswith(GZIP_MAGIC) or head[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + 5] == b'ustar':
+                layers[member.name] = scan_layer(PrefixedReader(head, fileobj), hash_min_size)
+            elif member.size < 16 * 1024 * 1024:
+                try:
+                    documents[member.name] = json.loads(head + fileobj.read())
+                except ValueError:
+                    pass
+    if 'manifest.json' not in documents:
+        raise ValueError(f'{path} is not a docker save archive (no manifest.json)')
+    return documents['manifest.json'][0], documents, layers
+
+
+def categorize(path, categories):
+    for name, prefixes in categories:
+        if any(path.startswith(p) for p in prefixes):
+            return name
+    return 'other'
+
+
+def resolve_categories(env):
+    resolved = []
+    for name, prefixes in CATEGORIES:
+        paths = []
+        for prefix in prefixes:
+            for key, value in env.items():
+                prefix = prefix.replace(f'${{{key}}}', normalize(value).rstrip('/'))
+            if '${' not in prefix:
+                paths.append(prefix)
+        resolved.append((name, paths))
+    return resolved
+
+
+def analyze(path, hash_min_size=1024 * 1024, dir_depth=3, top=20):
+    manifest, documents, layers = read_archive(path, hash_min_size)
+    config = documents.get(manifest['Config'], {})
+    env = dict(e.split('=', 1) for e in config.get('config', {}).get('Env', []))
+    categories = resolve_categories(env)
+
+    # Non-empty history entries correspond to the layers, in order
+    history = [h for h in config.get('history', []) if not h.get('empty_layer')]
+    if len(history) != len(manifest['Layers']):
+        history = [{}] * len(manifest['Layers'])
+
+    instructions = []
+    category_sizes = defaultdict(int)
+    dir_sizes = defaultdict(int)
+    live = LiveFiles()
+    wasted = defaultdict(int)
+    by_digest = defaultdict(set)
+
+    for index, (layer_name, entry) in enumerate(zip(manifest['Layers'], history)):
+        layer = layers.get(layer_name, {'files': {}, 'whiteouts': []})
+        for deleted in layer['whiteouts']:
+            if deleted.endswith('/'):
+                wasted['deleted'] += live.delete(deleted.rstrip('/'), contents_only=True)
+            else:
+                wasted['deleted'] += live.delete(deleted)
+        size = 0
+        for p, (file_size, digest) in layer['files'].items():
+            size += file_size
+            previous = live.add(p, (index, file_size, digest))
+            if previous is not None:
+                # The replaced copy is counted as overwritten only, even if its content is identical
+                wasted['overwritten'] += previous[1]
+                if previous[2] is not None:
+                    by_digest[(previous[2], previous[1])].discard((previous[0], p))
+            if digest is not None:
+                by_digest[(digest, file_size)].add((index, p))
+        instructions.append({
+            'layer': index,
+            'size': size,
+            'files': len(layer['files']),
+            'created_by': (entry.get('created_by') or '').replace('/bin/sh -c #(nop) ', '').strip(),
+        })
+
+    for p, (_, file_size, _) in live.files.items():
+        category_sizes[categorize(p, categories)] += file_size
+        parts = p.split('/')
+        for depth in range(1, min(dir_depth, len(parts) - 1) + 1):
+            dir_sizes['/' + '/'.join(parts[:depth])] += file_size
+
+    duplicates = []
+    for (digest, file_size), copies in by_digest.items():
+        copies = sorted(copies)
+        if len(copies) > 1:
+            duplicates.append({'size': file_size, 'copies': len(copies), 'wasted': file_size * (len(copies) - 1),
+                               'paths': ['/' + p for _, p in copies]})
+    duplicates.sort(key=lambda d: -d['wasted'])
+
+    deepest = sorted(dir_sizes.items(), key=lambda d: -d[1])
+    return {
+        'image': path,
+        'tags': manifest.get('RepoTags') or [],
+        'total_size': sum(i['size'] for i in instructions),
+        'final_size': sum(f[1] for f in live.files.values()),
+        'instructions': instructions,
+        'categories': dict(sorted(category_sizes.items(), key=lambda c: -c[1])),
+        'directories': dict(deepest[:top] if top else deepest),
+        'wasted': {
+            'overwritten': wasted['overwritten'],
+            'deleted': wasted['deleted'],
+            'duplicate_content': sum(d['wasted'] for d in duplicates),
+        },
+        'duplicates': duplicates[:top] if top else duplicates,
+    }
+
+
+def human(size):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(size) < 1024 or unit == 'GiB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+def signed(size):
+    return ('+' if size > 0 else '') + human(size)
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{report['image']} {' '.join(report['tags'])}", file=out)
+    print(f"  total {human(report['total_size'])} in {len(report['instructions'])} layers, "
+          f"{human(report['final_size'])} visible in the final filesystem\n", file=out)
+
+    print('Layers by instruction:', file=out)
+    for i in report['instructions']:
+        print(f"  {human(i['size']):>10}  {i['created_by'][:100]}", file=out)
+
+    print('\nBy component:', file=out)
+    for name, size in report['categories'].items():
+        print(f'  {human(size):>10}  {name}', file=out)
+
+    print('\nLargest directories:', file=out)
+    for name, size in report['directories'].items():
+        print(f'  {human(size):>10}  {name}', file=out)
+
+    print('\nWasted bytes:', file=out)
+    for name, size in report['wasted'].items():
+        print(f"  {human(size):>10}  {name.replace('_', ' ')}", file=out)
+    for d in report['duplicates']:
+        print(f"  {human(d['wasted']):>10}  {d['copies']} copies of {human(d['size'])}: {', '.join(d['paths'])}",
+              file=out)
+
+
+def diff_reports(old, new):
+    def diff(a, b):
+        keys = list(dict.fromkeys(list(b) + list(a)))
+        return {k: b.get(k, 0) - a.get(k, 0) for k in keys if b.get(k, 0) != a.get(k, 0)}
+
+    old_instructions = {i['created_by']: i['size'] for i in old['instructions']}
+    new_instructions = {i['created_by']: i['size'] for i in new['instructions']}
+    return {
+        'old': old['image'],
+        'new': new['image'],
+        'total_size': new['total_size'] - old['total_size'],
+        'categories': diff(old['categories'], new['categories']),
+        'directories': diff(old['directories'], new['directories']),
+        'instructions': diff(old_instructions, new_instructions),
+        'wasted': diff(old['wasted'], new['wasted']),
+    }
+
+
+def print_diff(delta, out=sys.stdout):
+    print(f"{delta['old']} -> {delta['new']}: {signed(delta['total_size'])}", file=out)
+    for section in ['categories', 'directories', 'instructions', 'wasted']:
+        if not delta[section]:
+            continue
+        print(f'\n{section.capitalize()}:', file=out)
+        for name, size in sorted(delta[section].items(), key=lambda d: -abs(d[1])):
+            print(f'  {signed(size):>12}  {name[:100]}', file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse the size of docker save archives offline.')
+    parser.add_argument('image', help='docker save tarball')
+    parser.add_argument('compare', nargs='?', help='a second tarball to compare against the first')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--top', type=int, default=20, help='number of directories/duplicates to list (default: 20)')
+    parser.add_argument('--depth', type=int, default=3, help='directory depth to aggregate sizes at (default: 3)')
+    parser.add_argument('--dup-min-size', type=int, default=1024 * 1024,
+                        help='minimum size in bytes of files checked for duplicate content (default: 1 MiB)')
+    args = parser.parse_args()
+
+    if args.compare:
+        # Directory sizes are compared in full, so that the diff is not limited to the top entries
+        old = analyze(args.image, args.dup_min_size, args.depth, 0)
+        new = analyze(args.compare, args.dup_min_size, args.depth, 0)
+        delta = diff_reports(old, new)
+        if args.json:
+            print(json.dumps(delta, indent=2))
+        else:
+            print_diff(delta)
+    else:
+        report = analyze(args.image, args.dup_min_size, args.depth, args.top)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+
+
+if __name__ == '__main__':
+    main()
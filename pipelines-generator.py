@@ -1,8 +1,23 @@
 from pathlib import Path
+import heapq
+import json
 import os
+import sys
 import jinja2 as j2
 
 TEMPLATE_FILE = 'bitbucket-pipelines.yml.j2'
+
+# Per-version build durations in seconds, keyed by flavour (the JDK key in `images`), e.g.
+#     {"17": {"9.4.1": 610, "9.5.0": 655}, "17-ubi": {...}}
+# When a flavour has history, its batches are planned from it; otherwise versions are split by
+# --job-offset/--jobs-total as before.
+HISTORY_FILE = os.environ.get('BUILD_HISTORY_FILE') or 'build-durations.json'
+
+# Fixed cost of every batch step (container start, submodule checkout, registry login, buildx setup)
+STEP_OVERHEAD = 120
+
+# Cost of a make-releases.py job for a range between versions in the history, which usually holds no release
+GAP_JOB_COST = 30
 images = {
 
     'Bamboo': {
@@ -50,12 +65,122 @@ images = {
 }
 
 
+def version_tuple(version):
+    return tuple(int(p) if p.isdigit() else 0 for p in version.split('.'))
+
+
+def in_range(version, start_version, end_version):
+    # Without an end version the range is unbounded, as for make-releases.py
+    if version_tuple(version) < version_tuple(start_version):
+        return False
+    return not end_version or version_tuple(version) < version_tuple(end_version)
+
+
+def patch_tuple(version):
+    return (version_tuple(version) + (0, 0, 0))[:3]
+
+
+def gap_jobs(versions, start_version, end_version):
+    """
+    Compute the version ranges that may hold released versions missing from the history: before the
+    first known version, after the last one and wherever the patch numbers of known versions are not
+    contiguous (including the step from one minor version to the next).
+    Parameters:
+    - versions (list): The known versions, sorted.
+    Returns:
+    - list: (start version, end version) ranges for make-releases.py; the end version is exclusive.
+    """
+    gaps = []
+    if patch_tuple(versions[0]) != patch_tuple(start_version):
+        gaps.append((start_version, versions[0]))
+    for prev, nxt in zip(versions, versions[1:]):
+        major, minor, patch = patch_tuple(prev)
+        if patch_tuple(nxt) != (major, minor, patch + 1):
+            gaps.append((f'{prev}.1', nxt))
+    gaps.append((f'{versions[-1]}.1', end_version))
+    return gaps
+
+
+def lpt_schedule(durations, batches):
+    """
+    Assign jobs to batches with longest-processing-time-first scheduling.
+    Parameters:
+    - durations (dict): Build duration in seconds per (start version, end version) job.
+    - batches (int): The number of batches.
+    Returns:
+    - list: (predicted seconds, [jobs]) per batch, excluding empty batches.
+    """
+    def job_key(job):
+        return version_tuple(job[0])
+
+    heap = [(0, i, []) for i in range(batches)]
+    for job in sorted(durations, key=lambda j: (-durations[j], job_key(j))):
+        load, i, jobs = heapq.heappop(heap)
+        jobs.append(job)
+        heapq.heappush(heap, (load + durations[job], i, jobs))
+    plan = [(load, sorted(jobs, key=job_key)) for load, i, jobs in sorted(heap, key=lambda b: b[1])]
+    return [b for b in plan if b[1]]
+
+
+def plan_batches(durations, max_batches, fillers=None):
+    """
+    Choose the smallest batch count, up to `max_batches`, with the minimum predicted makespan.
+    Parameters:
+    - durations (dict): Build duration in seconds per job.
+    - max_batches (int): The maximum number of batches.
+    - fillers (dict, optional): Cheap jobs that are spread over the batches once their count has been
+      chosen from `durations`, so that they never add batches. Defaults to None.
+    Returns:
+    - tuple: (predicted wall time in seconds, LPT plan)
+    """
+    best = None
+    for batches in range(1, min(max_batches, len(durations)) + 1):
+        plan = lpt_schedule(durations, batches)
+        makespan = STEP_OVERHEAD + max(load for load, _ in plan)
+        if best is None or makespan < best[0]:
+            best = (makespan, plan)
+    if fillers:
+        plan = lpt_schedule({**durations, **fillers}, len(best[1]))
+        best = (STEP_OVERHEAD + max(load for load, _ in plan), plan)
+    return best
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def apply_history(images, history, default_batches):
+    for name, pdata in images.items():
+        for jdkver, appdata in pdata.items():
+            start_version, end_version = appdata['start_version'], appdata.get('end_version', '')
+            flavour_history = history.get(str(jdkver), {})
+            known = {v: d for v, d in flavour_history.items() if in_range(v, start_version, end_version)}
+            if not known:
+                continue
+            # One make-releases.py job per version; the end version is exclusive, so '<version>.1' selects
+            # exactly that version
+            durations = {(v, f'{v}.1'): d for v, d in known.items()}
+            # Versions released since the history was recorded are built by jobs covering the gaps between
+            # known versions. These are usually empty, so they are added to the batches planned for the
+            # known versions rather than given batches of their own.
+            gaps = gap_jobs(sorted(known, key=version_tuple), start_version, end_version)
+            makespan, plan = plan_batches(durations, appdata.get('batches', default_batches),
+                                          {gap: GAP_JOB_COST for gap in gaps})
+            appdata['plan'] = [[(start, end, 0, 1) for start, end in jobs] for _, jobs in plan]
+            print(f'{name} JDK {jdkver}: {len(plan)} batches for {len(known)} versions and {len(gaps)} '
+                  f'version gaps, predicted wall time {makespan / 60:.1f} min', file=sys.stderr)
+
+
 def main():
     jenv = j2.Environment(
         loader=j2.FileSystemLoader('.'),
         lstrip_blocks=True,
         trim_blocks=True)
     template = jenv.get_template(TEMPLATE_FILE)
+    apply_history(images, load_history(HISTORY_FILE), 8)
     generated_output = template.render(images=images, batches=8)
 
     print(generated_output)
@@ -189,6 +189,59 @@ def gen_cfg(tmpl, target, user='root', group='root', mode=0o644, overwrite=True)
         if is_verbose_logging():
             logging.debug("Finished setting permissions for %s", target)
 
+def make_dir(path, user, group, mode):
+    """
+    Create a directory (and any missing parents) if it does not exist, and set its ownership and permissions.
+    Parameters:
+    - path (str): The directory path to create.
+    - user (str): The name of the user who will own the directory.
+    - group (str): The name of the group for the directory.
+    - mode (int): The permissions to set for the directory, in octal format (e.g., 0o750).
+    """
+    if is_verbose_logging():
+        logging.debug("Creating directory %s", path)
+    os.makedirs(path, exist_ok=True)
+    set_perms(path, user, group, mode)
+
+def link_scratch_dir(path, scratch_path, user, group, mode=0o750):
+    """
+    Relocate a non-durable, high-churn directory to scratch storage by replacing it with a symlink. This is
+    safe to repeat on every start. Existing data is never removed: a non-empty directory at `path` is left
+    in place, and only an empty directory or a symlink is replaced.
+    Parameters:
+    - path (str): The directory to relocate, e.g. a temp directory within the application home.
+    - scratch_path (str): The directory on scratch storage to link to. It is created if necessary.
+    - user (str): The name of the user who will own the scratch directory.
+    - group (str): The name of the group for the scratch directory.
+    - mode (int, optional): The permissions to set for the scratch directory, in octal format. Defaults to 0o750.
+    Returns:
+    - bool: True if `path` now links to `scratch_path`, False if it was left in place.
+    """
+    make_dir(scratch_path, user, group, mode)
+    if os.path.islink(path):
+        if os.readlink(path) == scratch_path:
+            return True
+        os.unlink(path)
+    elif os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+    elif os.path.exists(path):
+        logging.warning("%s is not empty; not relocating it to %s", path, scratch_path)
+        return False
+    logging.info("Linking %s to scratch directory %s", path, scratch_path)
+    os.symlink(scratch_path, path)
+    return True
+
+def unlink_dangling_dir(path):
+    """
+    Remove a symlink whose target no longer exists, e.g. one created by `link_scratch_dir` for scratch storage
+    that is no longer mounted. Real files and directories, and valid symlinks, are left untouched.
+    Parameters:
+    - path (str): The path to check.
+    """
+    if os.path.islink(path) and not os.path.exists(path):
+        logging.info("Removing dangling symlink %s", path)
+        os.unlink(path)
+
 def gen_container_id():
     """
     Generate a unique container ID and optionally update the environment variable 'local_container_id' with a value
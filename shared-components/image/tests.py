@@ -1,3 +1,6 @@
+import grp
+import os
+import pwd
 import pytest
 
 import entrypoint_helpers as eh
@@ -30,3 +33,40 @@ def test_str2bool_or():
     assert not eh.str2bool_or('false', True)
     assert not eh.str2bool_or('n', True)
     assert not eh.str2bool_or('something else', True)
+
+def test_link_scratch_dir(tmp_path):
+    user = pwd.getpwuid(os.getuid()).pw_name
+    group = grp.getgrgid(os.getgid()).gr_name
+    home, scratch = tmp_path / 'home', tmp_path / 'scratch'
+
+    # Missing and empty directories are relocated
+    (home / 'empty').mkdir(parents=True)
+    assert eh.link_scratch_dir(str(home / 'missing'), str(scratch / 'missing'), user, group)
+    assert eh.link_scratch_dir(str(home / 'empty'), str(scratch / 'empty'), user, group)
+    assert os.readlink(home / 'missing') == str(scratch / 'missing')
+    assert os.readlink(home / 'empty') == str(scratch / 'empty')
+
+    # Repeating is a no-op, and a recreated scratch volume is repopulated
+    os.rmdir(scratch / 'missing')
+    assert eh.link_scratch_dir(str(home / 'missing'), str(scratch / 'missing'), user, group)
+    assert (scratch / 'missing').is_dir()
+
+    # Data is never touched
+    (home / 'data').mkdir()
+    (home / 'data' / 'file').write_text('durable')
+    assert not eh.link_scratch_dir(str(home / 'data'), str(scratch / 'data'), user, group)
+    assert (home / 'data' / 'file').read_text() == 'durable'
+
+def test_unlink_dangling_dir(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir()
+    os.symlink(target, tmp_path / 'valid')
+    os.symlink(tmp_path / 'gone', tmp_path / 'dangling')
+
+    eh.unlink_dangling_dir(str(tmp_path / 'valid'))
+    eh.unlink_dangling_dir(str(tmp_path / 'dangling'))
+    eh.unlink_dangling_dir(str(target))
+
+    assert os.path.islink(tmp_path / 'valid')
+    assert not os.path.lexists(tmp_path / 'dangling')
+    assert target.is_dir()
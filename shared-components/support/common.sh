@@ -6,8 +6,11 @@
 # Set up Java utils
 JCMD="${JAVA_HOME}/bin/jcmd"
 
-# Set up app info
-APP_NAME="$(set | grep '_INSTALL_DIR' | awk -F'_' '{print $1}')"
+# Set up app info. An APP_NAME set by the caller is kept if it names the <APP>_INSTALL_DIR
+# variable; otherwise it is inferred from the environment.
+if [[ ! "${APP_NAME:-}" =~ ^[A-Z][A-Z0-9]*$ ]] || [[ ! -v "${APP_NAME}_INSTALL_DIR" ]]; then
+    APP_NAME="$(set | grep '_INSTALL_DIR' | awk -F'_' '{print $1}')"
+fi
 
 case "${APP_NAME}" in
     BITBUCKET )
@@ -33,11 +36,62 @@ function get_app_home {
     echo ${!APP_HOME}
 }
 
+# Check whether the given PID is a running JVM for BOOTSTRAP_PROC
+function is_app_jvm {
+    local pid=$1
+    local -a args
+    [[ -n "${pid}" && "${pid}" != "$$" ]] || return 1
+    mapfile -d '' -t args 2> /dev/null < "/proc/${pid}/cmdline" || return 1
+    [[ ${#args[@]} -gt 0 && "${args[0]##*/}" == "java" && " ${args[*]} " == *"${BOOTSTRAP_PROC}"* ]]
+}
+
+# Read a PID from a file, if it exists
+function read_pid {
+    local pid=""
+    read -r pid 2> /dev/null < "$1" || true
+    echo "${pid}"
+}
+
+# Find the JVM for BOOTSTRAP_PROC by scanning /proc. This avoids
+# attaching to every JVM in the container, as `jcmd` does.
+function find_app_jvm {
+    local proc
+    for proc in /proc/[0-9]*; do
+        if is_app_jvm "${proc#/proc/}"; then
+            echo "${proc#/proc/}"
+            return 0
+        fi
+    done
+    return 1
+}
+
 # Get app PID. APP_PID is the root process. JVM_APP_PID will generally
 # be the same as APP_PID; the exception is Bitbucket running with
 # Elasticsearch enabled.
-JVM_APP_PID=$(${JCMD} | grep "${BOOTSTRAP_PROC}" | awk '{print $1}')
+#
+# The JVM PID is resolved from the PID cached by a previous run, the
+# pidfile written by the entrypoint (which execs into the JVM), and
+# finally a scan of /proc. Every candidate is validated against its
+# command line, so a stale cache or pidfile is never used. jcmd is
+# only used as a last resort.
 PIDFILE="$(get_app_home)/docker-app.pid"
+JVM_PID_CACHE="${TMPDIR:-/tmp}/.${APP_NAME,,}-jvm.pid"
+
+JVM_APP_PID=""
+for candidate in "$(read_pid ${JVM_PID_CACHE})" "$(read_pid ${PIDFILE})"; do
+    if is_app_jvm "${candidate}"; then
+        JVM_APP_PID=${candidate}
+        break
+    fi
+done
+if [[ -z "${JVM_APP_PID}" ]]; then
+    JVM_APP_PID=$(find_app_jvm || ${JCMD} | grep "${BOOTSTRAP_PROC}" | awk '{print $1}')
+    if [[ -n "${JVM_APP_PID}" ]]; then
+        echo "${JVM_APP_PID}" 2> /dev/null > "${JVM_PID_CACHE}" || true
+    fi
+fi
+unset candidate
+
 if [[ -f $PIDFILE ]]; then
     APP_PID=$(<$PIDFILE)
 else
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# GC pause statistics from unified JVM logs (-Xlog:gc*,safepoint)
+#
+# Stream-parses GC logs written with the 'uptime' decoration and reports, per time
+# window: pause count and percentiles (p50/p99/max), allocation rate, promotion rate,
+# safepoint time and GC overhead. For example, to summarise the application's rotated
+# GC logs in 5 minute windows:
+#
+#     $ docker exec my_bamboo /opt/atlassian/support/gc_stats.py --window 300
+#
+# One JSON object is written per window. Pass --total to only report the whole period.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+
+UNITS = {'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+UPTIME = re.compile(r'\[(\d+(?:\.\d+)?)s\]')
+PAUSE = re.compile(r'GC\((\d+)\) (Pause .*?)'
+                   r'(?: (\d+)([BKMGT])->(\d+)([BKMGT])\((\d+)[BKMGT]\))? (\d+(?:\.\d+)?)ms$')
+REGION_SIZE = re.compile(r'Heap Region Size: (\d+)([BKMGT])')
+OLD_REGIONS = re.compile(r'GC\((\d+)\) Old regions: (\d+)->(\d+)')
+GC_CPU = re.compile(r'GC\((\d+)\) User=(\d+(?:\.\d+)?)s Sys=(\d+(?:\.\d+)?)s')
+SAFEPOINT_JDK17 = re.compile(r'Safepoint ".*", .*Total: (\d+) ns')
+SAFEPOINT_JDK11 = re.compile(r'Total time for which application threads were stopped: (\d+(?:\.\d+)?) seconds')
+
+
+def to_bytes(value, unit):
+    return int(value) * UNITS[unit]
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Window:
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.pauses = []
+        self.allocated = 0
+        self.promoted = 0
+        self.gc_cpu = 0.0
+        self.safepoint = 0.0
+
+    def report(self):
+        duration = self.end - self.start
+        pauses = sorted(self.pauses)
+        pause_total = sum(pauses) / 1000
+        return {
+            'start': round(self.start, 3),
+            'end': round(self.end, 3),
+            'pauses': len(pauses),
+            'pause_ms_p50': percentile(pauses, 50),
+            'pause_ms_p99': percentile(pauses, 99),
+            'pause_ms_max': pauses[-1] if pauses else None,
+            'pause_seconds_total': round(pause_total, 3),
+            'allocation_rate_mb_s': round(self.allocated / UNITS['M'] / duration, 3) if duration > 0 else None,
+            'promotion_rate_mb_s': round(self.promoted / UNITS['M'] / duration, 3) if duration > 0 else None,
+            'safepoint_seconds_total': round(self.safepoint, 3),
+            'gc_cpu_seconds_total': round(self.gc_cpu, 3),
+            'gc_overhead_pct': round(100 * pause_total / duration, 3) if duration > 0 else None,
+        }
+
+
+class GcLogParser:
+    """
+    Incrementally parses unified GC log lines into per-window statistics. Only the current window is held in
+    memory, so arbitrarily large logs can be processed.
+    """
+    def __init__(self, window=60):
+        self.window_size = window
+        self.window = None
+        self.region_size = None
+        self.last_uptime = None
+        self.heap_after_last_gc = None
+
+    def feed(self, line):
+        """
+        Parse a single log line.
+        Returns:
+        - dict: The report for the window that this line closed, if any, otherwise None.
+        """
+        line = line.rstrip()
+        m = UPTIME.search(line)
+        if m is None:
+            return None
+        uptime = float(m.group(1))
+
+        closed = None
+        if self.last_uptime is not None and uptime < self.last_uptime:
+            # The JVM was restarted; nothing carries over
+            closed = self.flush()
+            self.heap_after_last_gc = None
+        elif self.window is not None and self.window_size and uptime >= self.window.start + self.window_size:
+            closed = self.flush()
+        if self.window is None:
+            self.window = Window(uptime)
+        self.window.end = uptime
+        self.last_uptime = uptime
+
+        m = PAUSE.search(line)
+        if m is not None:
+            self.window.pauses.append(float(m.group(8)))
+            if m.group(3) is not None:
+                before = to_bytes(m.group(3), m.group(4))
+                if self.heap_after_last_gc is not None and before >= self.heap_after_last_gc:
+                    self.window.allocated += before - self.heap_after_last_gc
+                self.heap_after_last_gc = to_bytes(m.group(5), m.group(6))
+            return closed
+
+        m = OLD_REGIONS.search(line)
+        if m is not None and self.region_size:
+            growth = int(m.group(3)) - int(m.group(2))
+            if growth > 0:
+                self.window.promoted += growth * self.region_size
+            return closed
+
+        m = GC_CPU.search(line)
+        if m is not None:
+            self.window.gc_cpu += float(m.group(2)) + float(m.group(3))
+            return closed
+
+        m = SAFEPOINT_JDK17.search(line)
+        if m is not None:
+            self.window.safepoint += int(m.group(1)) / 1e9
+            return closed
+        m = SAFEPOINT_JDK11.search(line)
+        if m is not None:
+            self.window.safepoint += float(m.group(1))
+            return closed
+
+        m = REGION_SIZE.search(line)
+        if m is not None:
+            self.region_size = to_bytes(m.group(1), m.group(2))
+        return closed
+
+    def flush(self):
+        """
+        Close the current window, returning its report (or None if there is no open window).
+        """
+        if self.window is None:
+            return None
+        report = self.window.report()
+        self.window = None
+        return report
+
+
+def default_logs():
+    install_dir = os.environ.get(f"{os.environ.get('APP_NAME', '').upper()}_INSTALL_DIR", '')
+    logs = glob.glob(f'{install_dir}/logs/gc.log*')
+    # Rotated files are numbered cyclically, so order by age instead
+    return sorted(logs, key=os.path.getmtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise GC pauses from unified JVM GC logs.')
+    parser.add_argument('logs', nargs='*', help='GC log files, oldest first (default: <install dir>/logs/gc.log*)')
+    parser.add_argument('-w', '--window', type=float, default=60, help='window size in seconds (default: 60)')
+    parser.add_argument('-t', '--total', action='store_true', help='report a single window covering all input')
+    args = parser.parse_args()
+
+    logs = args.logs or default_logs()
+    if not logs:
+        print('No GC logs found; is ATL_GC_LOG enabled?', file=sys.stderr)
+        return 1
+
+    gc_parser = GcLogParser(0 if args.total else args.window)
+    for log in logs:
+        with open(log, encoding='utf-8', errors='replace') as fd:
+            for line in fd:
+                report = gc_parser.feed(line)
+                if report is not None:
+                    print(json.dumps(report))
+    report = gc_parser.flush()
+    if report is not None:
+        print(json.dumps(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
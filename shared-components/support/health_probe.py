@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Cached health probe for containerized Atlassian applications
+#
+# Orchestrator probes usually request the application's /status endpoint several times
+# a minute, each time on a new connection. This probe caches the last reported state for
+# a short TTL, so that liveness and readiness checks share a single request. As an exec
+# probe, it exits with a code that identifies the state:
+#
+#     $ /opt/atlassian/support/health_probe.py --accept RUNNING --accept FIRST_RUN
+#
+# The cache is a file per status URL, so it is shared between exec probes of the same
+# URL. To also answer HTTP probes (on any path; the status code is 200 for accepted states
+# and 503 otherwise), and to refresh the cache over a single keep-alive connection, run it
+# as a server:
+#
+#     $ docker exec -d my_bamboo /opt/atlassian/support/health_probe.py --listen 8086
+#
+# Exit codes: 0 accepted state, 1 unreachable, 2 STARTING, 3 FIRST_RUN, 4 ERROR,
+# 5 STOPPING, 6 any other state. Unless accepted, RUNNING exits with 7.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_TTL = 5
+REQUEST_TIMEOUT = 5
+
+EXIT_ACCEPTED = 0
+EXIT_UNREACHABLE = 1
+EXIT_CODES = {
+    'STARTING': 2,
+    'FIRST_RUN': 3,
+    'ERROR': 4,
+    'STOPPING': 5,
+    'RUNNING': 7,
+}
+EXIT_OTHER = 6
+
+
+def default_url():
+    port = os.environ.get('ATL_TOMCAT_PORT') or '8085'
+    context = (os.environ.get('ATL_TOMCAT_CONTEXTPATH') or '').rstrip('/')
+    return f'http://localhost:{port}{context}/status'
+
+
+def default_cache_file(url):
+    app = next((k.split('_')[0] for k in os.environ if k.endswith('_INSTALL_DIR')), 'app').lower()
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(os.environ.get('TMPDIR', '/tmp'), f'.{app}-status-{key}.json')
+
+
+class StatusClient:
+    """
+    Fetches the application state over a persistent connection, reconnecting when the server closes it.
+    """
+    def __init__(self, url):
+        self.url = url
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.conn = None
+
+    def request(self):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        self.conn.request('GET', self.path, headers={'Accept': 'application/json'})
+        response = self.conn.getresponse()
+        body = response.read()
+        if response.will_close:
+            self.close()
+        return response.status, body
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def fetch(self):
+        """
+        Returns:
+        - dict: The state ('state' is None if the application is unreachable) and when it was fetched.
+        """
+        for attempt in range(2):
+            try:
+                status, body = self.request()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                # A kept-alive connection may have been closed by the server in the meantime; retry once
+                self.close()
+                error = str(e) or type(e).__name__
+        else:
+            return {'url': self.url, 'state': None, 'error': error, 'time': time.time()}
+        try:
+            state = json.loads(body.decode('utf-8')).get('state')
+        except (ValueError, AttributeError):
+            return {'url': self.url, 'state': None, 'error': f'HTTP {status}: unexpected response',
+                    'time': time.time()}
+        return {'url': self.url, 'state': state, 'http_status': status, 'time': time.time()}
+
+
+def read_cache(path, url, ttl):
+    try:
+        with open(path, encoding='utf-8') as fd:
+            cached = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    # A cache file given with --cache-file may have been written for another URL
+    if not isinstance(cached, dict) or cached.get('url') != url or time.time() - cached.get('time', 0) >= ttl:
+        return None
+    return cached
+
+
+def write_cache(path, status):
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is an optimisation only, e.g. when probing as a different user
+        pass
+
+
+class CachedStatus:
+    """
+    Fetches the state at most once per TTL, however often it is requested.
+    """
+    def __init__(self, client, cache_file, ttl):
+        self.client = client
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.status = None
+
+    def get(self):
+        with self.lock:
+            if self.status is None or time.time() - self.status['time'] >= self.ttl:
+                self.status = self.client.fetch()
+                write_cache(self.cache_file, self.status)
+            return self.status
+
+
+def exit_code(state, accepted):
+    if state is None:
+        return EXIT_UNREACHABLE
+    if state in accepted:
+        return EXIT_ACCEPTED
+    return EXIT_CODES.get(state, EXIT_OTHER)
+
+
+def serve(status, port, accepted):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            current = status.get()
+            body = json.dumps(current).encode('utf-8')
+            self.send_response(200 if exit_code(current['state'], accepted) == EXIT_ACCEPTED else 503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    http.server.ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Probe the application state, caching it for a short time.')
+    parser.add_argument('-u', '--url', default=None,
+                        help='status URL (default: http://localhost:$ATL_TOMCAT_PORT$ATL_TOMCAT_CONTEXTPATH/status)')
+    parser.add_argument('-a', '--accept', action='append', default=None, metavar='STATE',
+                        help='state that exits with 0; may be repeated (default: RUNNING)')
+    parser.add_argument('-t', '--ttl', type=float, default=DEFAULT_TTL,
+                        help=f'seconds to cache the state for (default: {DEFAULT_TTL})')
+    parser.add_argument('-c', '--cache-file', default=None,
+                        help='state cache file (default: $TMPDIR/.<app>-status-<URL hash>.json)')
+    parser.add_argument('-l', '--listen', type=int, default=None, metavar='PORT',
+                        help='serve the cached state to HTTP probes on this port')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the state')
+    args = parser.parse_args()
+
+    accepted = set(args.accept or ['RUNNING'])
+    url = args.url or default_url()
+    cache_file = args.cache_file or default_cache_file(url)
+    client = StatusClient(url)
+    if args.listen is not None:
+        serve(CachedStatus(client, cache_file, args.ttl), args.listen, accepted)
+        return 0
+
+    current = read_cache(cache_file, url, args.ttl)
+    if current is None:
+        current = client.fetch()
+        client.close()
+        write_cache(cache_file, current)
+    if not args.quiet:
+        print(current['state'] or f"unreachable: {current.get('error')}")
+    return exit_code(current['state'], accepted)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
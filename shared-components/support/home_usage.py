@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Disk usage profiler for the home directory of containerized Atlassian applications
+#
+# Walks the home directory with a pool of threads, so that the latency of network and
+# block storage is overlapped, and reports bytes and file counts by area (artifacts,
+# build logs, caches, index, temp, ...), by plan key and for the largest subtrees as
+# JSON. For example:
+#
+#     $ docker exec my_bamboo /opt/atlassian/support/home_usage.py > usage.json
+#
+# Only per-directory aggregates are kept, so memory use is bounded by the number of
+# directories up to -d/--depth rather than by the number of files. Symbolic links
+# (e.g. to scratch storage) are not followed. Use -p/--progress to stream running totals
+# to stderr while a large home is being walked.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+SUPPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Areas of the home directory, matched on the leading path components (longest first)
+AREAS = [
+    (('xml-data', 'builds'), 'build-logs'),
+    (('xml-data', 'build-dir'), 'working-dirs'),
+    (('local-working-dir',), 'working-dirs'),
+    (('artifacts',), 'artifacts'),
+    (('shared', 'artifacts'), 'artifacts'),
+    (('caches',), 'caches'),
+    (('index',), 'index'),
+    (('temp',), 'temp'),
+    (('logs',), 'logs'),
+    (('backups',), 'backups'),
+    (('exports',), 'backups'),
+    (('database',), 'database'),
+    (('plugins',), 'plugins'),
+]
+
+# Path components that identify the plan the data below them belongs to: build result and working
+# directories are named after the job key (PROJ-PLAN-JOB), artifact directories after the plan key or ID
+PLAN_DIRS = {
+    ('xml-data', 'builds'),
+    ('xml-data', 'build-dir'),
+    ('local-working-dir',),
+    ('artifacts',),
+    ('shared', 'artifacts'),
+}
+PLAN_KEY = re.compile(r'^(plan-\d+|[A-Z][A-Z0-9_]*-[A-Z][A-Z0-9_]*)')
+
+
+def get_app_home():
+    cmd = f'source {SUPPORT_DIR}/common.sh && get_app_home'
+    out = subprocess.run(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE, check=True).stdout
+    return out.decode().strip()
+
+
+def classify(parts):
+    """
+    Determine the area and plan key of a directory from its path components relative to the home.
+    Parameters:
+    - parts (tuple): The path components, e.g. ('xml-data', 'builds', 'PROJ-PLAN-JOB1', 'download-data').
+    Returns:
+    - tuple: An (area, plan key or None) tuple.
+    """
+    area = 'other'
+    for prefix, name in AREAS:
+        if parts[:len(prefix)] == prefix:
+            area = name
+            break
+    plan = None
+    for prefix in PLAN_DIRS:
+        if parts[:len(prefix)] == prefix and len(parts) > len(prefix):
+            m = PLAN_KEY.match(parts[len(prefix)])
+            if m:
+                plan = m.group(1)
+            break
+    return area, plan
+
+
+def new_counter():
+    return [0, 0, 0]    # files, bytes, allocated bytes
+
+
+class Stats:
+    """
+    Aggregates collected by a single worker thread; merged once the walk is complete.
+    """
+    def __init__(self, depth):
+        self.depth = depth
+        self.totals = new_counter()
+        self.dirs = 0
+        self.errors = 0
+        self.areas = defaultdict(new_counter)
+        self.plans = defaultdict(new_counter)
+        self.subtrees = defaultdict(new_counter)
+
+    def add(self, parts, area, plan, counter):
+        for target in [self.totals, self.areas[area]] + ([self.plans[plan]] if plan else []) + \
+                [self.subtrees[parts[:i]] for i in range(1, min(self.depth, len(parts)) + 1)]:
+            for i, value in enumerate(counter):
+                target[i] += value
+
+    def merge(self, other):
+        self.dirs += other.dirs
+        self.errors += other.errors
+        for i, value in enumerate(other.totals):
+            self.totals[i] += value
+        for mine, theirs in ((self.areas, other.areas), (self.plans, other.plans), (self.subtrees, other.subtrees)):
+            for key, counter in theirs.items():
+                for i, value in enumerate(counter):
+                    mine[key][i] += value
+
+
+def scan_dir(path, parts, stats, pending):
+    counter = new_counter()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.put((entry.path, parts + (entry.name,)))
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    stats.errors += 1
+                    continue
+                counter[0] += 1
+                counter[1] += st.st_size
+                counter[2] += st.st_blocks * 512
+    except OSError:
+        stats.errors += 1
+        return
+    stats.dirs += 1
+    stats.add(parts, *classify(parts), counter)
+
+
+def walk(home, workers=16, depth=3, progress=None):
+    """
+    Walk `home` with `workers` threads.
+    Parameters:
+    - home (str): The directory to profile.
+    - workers (int, optional): The number of threads. Defaults to 16.
+    - depth (int, optional): The maximum depth of the subtrees that sizes are reported for. Defaults to 3.
+    - progress (float, optional): Write running totals to stderr every `progress` seconds. Defaults to None.
+    Returns:
+    - Stats: The merged aggregates.
+    """
+    pending = queue.Queue()
+    pending.put((home, ()))
+    all_stats = [Stats(depth) for _ in range(workers)]
+
+    def worker(stats):
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            try:
+                scan_dir(*item, stats, pending)
+            finally:
+                pending.task_done()
+
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in all_stats]
+    for t in threads:
+        t.start()
+
+    if progress:
+        done = threading.Event()
+
+        def report():
+            start = time.monotonic()
+            while not done.wait(progress):
+                # Unsynchronised reads; the totals are only indicative while the walk is running
+                print(json.dumps({
+                    'elapsed': round(time.monotonic() - start, 1),
+                    'dirs': sum(s.dirs for s in all_stats),
+                    'files': sum(s.totals[0] for s in all_stats),
+                    'bytes': sum(s.totals[1] for s in all_stats),
+                    'queued': pending.qsize(),
+                }), file=sys.stderr, flush=True)
+
+        reporter = threading.Thread(target=report, daemon=True)
+        reporter.start()
+
+    pending.join()
+    for _ in threads:
+        pending.put(None)
+    for t in threads:
+        t.join()
+    if progress:
+        done.set()
+        reporter.join()
+
+    merged = Stats(depth)
+    for stats in all_stats:
+        merged.merge(stats)
+    return merged
+
+
+def counter_dict(counter):
+    return {'files': counter[0], 'bytes': counter[1], 'disk': counter[2]}
+
+
+def largest(counters, top):
+    return sorted(counters.items(), key=lambda c: -c[1][2])[:top]
+
+
+def build_report(home, stats, top, elapsed):
+    return {
+        'home': home,
+        'elapsed': round(elapsed, 3),
+        'dirs': stats.dirs,
+        'errors': stats.errors,
+        'totals': counter_dict(stats.totals),
+        'areas': {k: counter_dict(v) for k, v in largest(stats.areas, None)},
+        'plans': {k: counter_dict(v) for k, v in largest(stats.plans, top)},
+        'subtrees': [dict(path='/'.join(k), **counter_dict(v)) for k, v in largest(stats.subtrees, top)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the disk usage of the application home directory.')
+    parser.add_argument('home', nargs='?', default=None, help='directory to profile (default: the application home)')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='number of scanning threads (default: 16)')
+    parser.add_argument('-d', '--depth', type=int, default=3,
+                        help='maximum depth of the reported subtrees (default: 3)')
+    parser.add_argument('-n', '--top', type=int, default=20,
+                        help='number of plans and subtrees to report (default: 20)')
+    parser.add_argument('-p', '--progress', type=float, default=None, metavar='SECONDS',
+                        help='write running totals to stderr at this interval')
+    args = parser.parse_args()
+
+    home = args.home or get_app_home()
+    start = time.monotonic()
+    stats = walk(home, args.workers, args.depth, args.progress)
+    print(json.dumps(build_report(home, stats, args.top, time.monotonic() - start), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/bin/bash
+
+# -------------------------------------------------------------------------------------
+# Java Flight Recorder snapshot collector for containerized Atlassian applications
+#
+# This script can be run via `docker exec` to dump the contents of an already running
+# flight recording (e.g. one started via ATL_JFR_MODE) from the containerized
+# application. For example:
+#
+#     $ docker exec my_bamboo /opt/atlassian/support/jfr-dump.sh
+#
+# A recording will be written to $APP_HOME/jfr/. By default the recording named
+# 'atlassian' is dumped; use -n/--name to select another recording, and -a/--maxage to
+# only dump the most recent data (e.g. '-a 10m').
+#
+# -------------------------------------------------------------------------------------
+
+
+set -euo pipefail
+
+
+# Set up common vars like APP_NAME, APP_HOME, APP_PID
+SCRIPT_DIR=$(dirname "$0")
+source "${SCRIPT_DIR}/common.sh"
+
+# Set up script opts
+set_valid_options "n:a:" "name:,maxage:"
+
+# Set defaults
+NAME="atlassian"
+MAXAGE=""
+
+# Parse opts
+while true; do
+    case "${1-}" in
+        -n | --name )       NAME="$2"; shift 2 ;;
+        -a | --maxage )     MAXAGE="$2"; shift 2 ;;
+        * ) break ;;
+    esac
+done
+
+
+
+echo "Atlassian flight recording collector"
+echo "App:       ${APP_NAME}"
+echo "Run user:  ${RUN_USER}"
+echo
+
+OUT_DIR="$(get_app_home)/jfr"
+OUT_FILE="${OUT_DIR}/${APP_NAME}_$(date +'%Y-%m-%d_%H-%M-%S').jfr"
+run_as_runuser mkdir -p ${OUT_DIR}
+
+echo "Dumping flight recording '${NAME}'"
+# jcmd reports some failures (e.g. an unknown recording) on stdout only, so also check for the file
+if ! OUTPUT=$(run_as_runuser ${JCMD} ${JVM_APP_PID} JFR.dump name=${NAME} filename=${OUT_FILE} ${MAXAGE:+maxage=${MAXAGE}} 2>&1) \
+        || [[ ! -f "${OUT_FILE}" ]]; then
+    echo "Failed to dump flight recording '${NAME}':" >&2
+    echo "${OUTPUT}" >&2
+    exit 1
+fi
+echo
+echo "Flight recording has been written to ${OUT_FILE}"
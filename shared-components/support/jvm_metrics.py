@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Zero-attach JVM metrics for containerized Atlassian applications
+#
+# Reads the JVM's performance counters directly from its hsperfdata file
+# (/tmp/hsperfdata_<user>/<pid>), which the JVM updates in place. Unlike jcmd/jstat this
+# does not attach to the VM, so it is cheap enough to sample at a high frequency.
+# Metrics are rendered in the Prometheus text format. For example:
+#
+#     $ docker exec my_bamboo /opt/atlassian/support/jvm_metrics.py
+#
+# To serve the metrics over HTTP, refreshing them at most every 5 seconds:
+#
+#     $ docker exec -d my_bamboo /opt/atlassian/support/jvm_metrics.py --listen 9404 --interval 5
+#
+# Or to write them for the node_exporter textfile collector every 15 seconds:
+#
+#     $ docker exec -d my_bamboo /opt/atlassian/support/jvm_metrics.py --output /metrics/jvm.prom --interval 15
+#
+# NOTE: The JVM must not be started with -XX:-UsePerfData or -XX:+PerfDisableSharedMem.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import glob
+import http.server
+import mmap
+import os
+import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+PERFDATA_MAGIC = 0xcafec0c0
+PROLOGUE = struct.Struct('>IBBBBIIqii')
+ENTRY_HEADER = '{}iiiBBBBi'
+
+SUPPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_jvm_pid():
+    """
+    Resolve the application's JVM PID using the same discovery logic as the shell support scripts.
+    Returns:
+    - int: The PID of the application's JVM.
+    """
+    cmd = f'source {SUPPORT_DIR}/common.sh && echo ${{JVM_APP_PID}}'
+    out = subprocess.run(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE, check=True).stdout
+    return int(out.decode().strip())
+
+
+def find_perfdata(pid):
+    """
+    Locate the hsperfdata file of the given JVM.
+    Parameters:
+    - pid (int): The PID of the JVM.
+    Returns:
+    - str: The path of the hsperfdata file.
+    """
+    paths = glob.glob(f'/tmp/hsperfdata_*/{pid}')
+    if not paths:
+        raise FileNotFoundError(f'No hsperfdata file found for PID {pid}; is the JVM running with -XX:-UsePerfData?')
+    return paths[0]
+
+
+class PerfData:
+    """
+    A read-only, memory-mapped view of a JVM's hsperfdata file.
+    The entry directory is indexed once; reading a counter afterwards is a single `unpack_from` against the
+    mapping, so values are always current and never copied out of the page cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fd:
+            self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order = struct.unpack_from('>IB', self.map, 0)
+        if magic != PERFDATA_MAGIC:
+            raise ValueError(f'{path} is not an hsperfdata file')
+        self.order = '<' if byte_order == 1 else '>'
+        self.prologue = struct.Struct(self.order + PROLOGUE.format[1:])
+        self.entry_header = struct.Struct(ENTRY_HEADER.format(self.order))
+        self.long = struct.Struct(self.order + 'q')
+        self.num_entries = 0
+        self.entries = {}
+        self.index()
+
+    def close(self):
+        self.map.close()
+
+    def index(self):
+        """
+        (Re)build the name -> (type, offset, length) index. The JVM may append counters at runtime, so this is
+        repeated whenever the entry count changes.
+        """
+        _, _, _, _, _, _, _, _, entry_offset, num_entries = self.prologue.unpack_from(self.map, 0)
+        entries = {}
+        offset = entry_offset
+        for _ in range(num_entries):
+            length, name_offset, vector_length, data_type, _, _, _, data_offset = \
+                self.entry_header.unpack_from(self.map, offset)
+            name_start = offset + name_offset
+            name = bytes(self.map[name_start:self.map.find(b'\0', name_start)]).decode('ascii')
+            entries[name] = (chr(data_type), offset + data_offset, vector_length)
+            offset += length
+        self.entries = entries
+        self.num_entries = num_entries
+
+    def refresh(self):
+        num_entries = self.prologue.unpack_from(self.map, 0)[-1]
+        if num_entries != self.num_entries:
+            self.index()
+
+    def get(self, name, default=None):
+        """
+        Read the current value of a counter.
+        Parameters:
+        - name (str): The counter name, e.g. 'sun.gc.collector.0.invocations'.
+        - default (optional): The value to return if the counter does not exist. Defaults to None.
+        Returns:
+        - int or str: The counter value; long counters are returned as int, byte arrays as str.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return default
+        data_type, offset, vector_length = entry
+        if data_type == 'J' and vector_length == 0:
+            return self.long.unpack_from(self.map, offset)[0]
+        if data_type == 'B':
+            raw = self.map[offset:offset + vector_length]
+            return bytes(raw).split(b'\0', 1)[0].decode('utf-8', 'replace')
+        return default
+
+    def matching(self, pattern):
+        """
+        Yield (match, name) for every counter whose name matches the given regular expression.
+        """
+        rpat = re.compile(pattern)
+        for name in self.entries:
+            m = rpat.fullmatch(name)
+            if m:
+                yield m, name
+
+    def ticks_to_seconds(self, ticks):
+        return ticks / self.get('sun.os.hrt.frequency', 1)
+
+    def seconds(self, name):
+        """
+        Read a tick counter and convert it to seconds, or return None if it does not exist.
+        """
+        ticks = self.get(name)
+        return None if ticks is None else self.ticks_to_seconds(ticks)
+
+    def gc_time(self):
+        """
+        Return the total time spent in GC pauses so far, in seconds.
+        """
+        ticks = sum(self.get(name) for m, name in self.matching(r'sun\.gc\.collector\.\d+\.time'))
+        return self.ticks_to_seconds(ticks)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_metrics(perf):
+    """
+    Render the JVM metrics as Prometheus text.
+    Parameters:
+    - perf (PerfData): The perf data to read from.
+    Returns:
+    - str: The metrics in the Prometheus text exposition format.
+    """
+    perf.refresh()
+    out = []
+
+    def metric(name, mtype, help_text, samples):
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} {mtype}')
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_str = ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+            out.append(f'{name}{{{label_str}}} {value}' if label_str else f'{name} {value}')
+
+    collectors = [(m.group(1), perf.get(name)) for m, name in perf.matching(r'sun\.gc\.collector\.(\d+)\.name')]
+    metric('jvm_gc_collections_total', 'counter', 'Number of garbage collections.',
+           [({'collector': cname}, perf.get(f'sun.gc.collector.{n}.invocations')) for n, cname in collectors])
+    metric('jvm_gc_collection_seconds_total', 'counter', 'Time spent in garbage collection.',
+           [({'collector': cname}, perf.seconds(f'sun.gc.collector.{n}.time'))
+            for n, cname in collectors])
+
+    spaces = []
+    for m, name in perf.matching(r'sun\.gc\.generation\.(\d+)\.space\.(\d+)\.name'):
+        prefix = f'sun.gc.generation.{m.group(1)}'
+        labels = {'generation': perf.get(f'{prefix}.name'), 'space': perf.get(name)}
+        spaces.append((labels, f'{prefix}.space.{m.group(2)}'))
+    metric('jvm_memory_space_used_bytes', 'gauge', 'Used bytes of a heap space.',
+           [(labels, perf.get(f'{prefix}.used')) for labels, prefix in spaces])
+    metric('jvm_memory_space_capacity_bytes', 'gauge', 'Committed bytes of a heap space.',
+           [(labels, perf.get(f'{prefix}.capacity')) for labels, prefix in spaces])
+    metric('jvm_memory_space_max_bytes', 'gauge', 'Maximum bytes of a heap space.',
+           [(labels, perf.get(f'{prefix}.maxCapacity')) for labels, prefix in spaces])
+    metric('jvm_metaspace_used_bytes', 'gauge', 'Used bytes of metaspace.',
+           [({}, perf.get('sun.gc.metaspace.used'))])
+    metric('jvm_metaspace_capacity_bytes', 'gauge', 'Committed bytes of metaspace.',
+           [({}, perf.get('sun.gc.metaspace.capacity'))])
+
+    metric('jvm_classes_loaded_total', 'counter', 'Number of classes loaded.',
+           [({}, perf.get('java.cls.loadedClasses'))])
+    metric('jvm_classes_unloaded_total', 'counter', 'Number of classes unloaded.',
+           [({}, perf.get('java.cls.unloadedClasses'))])
+    metric('jvm_class_loading_seconds_total', 'counter', 'Time spent loading classes.',
+           [({}, perf.seconds('sun.cls.time'))])
+
+    metric('jvm_safepoints_total', 'counter', 'Number of safepoints.',
+           [({}, perf.get('sun.rt.safepoints'))])
+    metric('jvm_safepoint_seconds_total', 'counter', 'Time spent at safepoints.',
+           [({}, perf.seconds('sun.rt.safepointTime'))])
+    metric('jvm_safepoint_sync_seconds_total', 'counter', 'Time spent bringing threads to safepoints.',
+           [({}, perf.seconds('sun.rt.safepointSyncTime'))])
+
+    metric('jvm_threads_live', 'gauge', 'Number of live threads.', [({}, perf.get('java.threads.live'))])
+    metric('jvm_threads_daemon', 'gauge', 'Number of live daemon threads.', [({}, perf.get('java.threads.daemon'))])
+    metric('jvm_threads_peak', 'gauge', 'Peak number of live threads.', [({}, perf.get('java.threads.livePeak'))])
+
+    metric('jvm_uptime_seconds', 'gauge', 'Time since the JVM started.',
+           [({}, perf.seconds('sun.os.hrt.ticks'))])
+
+    return '\n'.join(out) + '\n'
+
+
+class CachedMetrics:
+    """
+    Renders metrics at most once per interval, however often they are requested.
+    """
+    def __init__(self, perf, interval):
+        self.perf = perf
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.rendered = None
+        self.rendered_at = 0
+
+    def get(self):
+        with self.lock:
+            if self.rendered is None or time.monotonic() - self.rendered_at >= self.interval:
+                self.rendered = render_metrics(self.perf)
+                self.rendered_at = time.monotonic()
+            return self.rendered
+
+
+def serve(metrics, port):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.get().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    http.server.ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+def write_periodically(metrics, path, interval):
+    while True:
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fd:
+            fd.write(metrics.get())
+        os.replace(tmp, path)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export JVM metrics from hsperfdata without attaching to the JVM.')
+    parser.add_argument('-p', '--pid', type=int, default=None, help='JVM PID (default: the application JVM)')
+    parser.add_argument('-l', '--listen', type=int, default=None, metavar='PORT',
+                        help='serve the metrics over HTTP on this port')
+    parser.add_argument('-o', '--output', default=None, metavar='FILE',
+                        help='periodically write the metrics to this file')
+    parser.add_argument('-i', '--interval', type=float, default=5,
+                        help='minimum number of seconds between samples (default: 5)')
+    args = parser.parse_args()
+
+    perf = PerfData(find_perfdata(args.pid or get_jvm_pid()))
+    metrics = CachedMetrics(perf, args.interval)
+    if args.listen is not None:
+        serve(metrics, args.listen)
+    elif args.output is not None:
+        write_periodically(metrics, args.output, args.interval)
+    else:
+        sys.stdout.write(metrics.get())
+
+
+if __name__ == '__main__':
+    main()
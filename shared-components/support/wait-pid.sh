@@ -7,6 +7,12 @@
 set -e
 
 WAIT_PID=$1
+SHDIR=$(dirname $0)
+
+# Prefer the event-driven (pidfd) waiter where python is available
+if command -v python3 > /dev/null; then
+    exec python3 ${SHDIR}/wait_pid.py ${WAIT_PID}
+fi
 
 while [[ -e /proc/${WAIT_PID} ]]; do
     /bin/sleep 0.5
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Wait for a process to terminate
+#
+# Uses a pidfd (Linux >= 5.3) so that we are woken by the kernel the moment the process
+# exits, rather than polling /proc. On older kernels we fall back to polling /proc with
+# an exponential backoff. For example:
+#
+#     $ /opt/atlassian/support/wait_pid.py 1234
+#
+# NOTE: By default this waits indefinitely, but may be killed by higher-level processes
+# (e.g. Docker/Kubernetes). Use -t/--timeout to bound the wait.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import os
+import select
+import sys
+import time
+
+POLL_MIN_INTERVAL = 0.005
+POLL_MAX_INTERVAL = 0.5
+
+
+def pid_exists(pid):
+    """
+    Check whether a process with the given PID is still running.
+    Parameters:
+    - pid (int): The process ID to check.
+    Returns:
+    - bool: True if the process exists and is not a zombie, False otherwise.
+    """
+    try:
+        with open(f'/proc/{pid}/stat', encoding='utf-8') as fd:
+            stat = fd.read()
+    except (FileNotFoundError, ProcessLookupError):
+        return False
+    # The state field follows the (possibly space-containing) command name
+    return stat[stat.rfind(')') + 2:][:1] not in ('Z', 'X')
+
+
+def _wait_pidfd(pid, deadline):
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return True
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        while True:
+            timeout_ms = None
+            if deadline is not None:
+                timeout_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            if poller.poll(timeout_ms):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+    finally:
+        os.close(pidfd)
+
+
+def _wait_poll(pid, deadline):
+    interval = POLL_MIN_INTERVAL
+    while pid_exists(pid):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            interval = min(interval, remaining)
+        time.sleep(interval)
+        interval = min(interval * 2, POLL_MAX_INTERVAL)
+    return True
+
+
+def wait_pid(pid, timeout=None):
+    """
+    Block until the given process has terminated.
+    Parameters:
+    - pid (int): The process ID to wait for. This need not be a child of the current process.
+    - timeout (float, optional): The maximum number of seconds to wait. Defaults to None (wait indefinitely).
+    Returns:
+    - float: The number of seconds spent waiting for the process to exit.
+    Raises:
+    - TimeoutError: If the process is still running once the timeout has elapsed.
+    """
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+
+    exited = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            exited = _wait_pidfd(pid, deadline)
+        except OSError:
+            # ENOSYS on kernels without pidfd support, EPERM under some seccomp profiles
+            exited = None
+    if exited is None:
+        exited = _wait_poll(pid, deadline)
+
+    elapsed = time.monotonic() - start
+    if not exited:
+        raise TimeoutError(f"Process {pid} still running after {elapsed:.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wait for a process to terminate.')
+    parser.add_argument('pid', type=int, help='process ID to wait for')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='maximum number of seconds to wait (default: wait indefinitely)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not report the measured exit latency')
+    args = parser.parse_args()
+
+    try:
+        elapsed = wait_pid(args.pid, args.timeout)
+    except TimeoutError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        print(f"Process {args.pid} exited after {elapsed:.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
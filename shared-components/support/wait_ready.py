@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Readiness probe for containerized Atlassian applications and their dependencies
+#
+# Checks any number of targets concurrently and exits as soon as all of them are ready,
+# or fails once the overall deadline has passed. For example, to wait for the database
+# configured via ATL_JDBC_URL, the embedded broker, and for the application to report
+# that it is running:
+#
+#     $ /opt/atlassian/support/wait_ready.py --jdbc --broker \
+#           --http http://localhost:8085/status --state RUNNING --state FIRST_RUN
+#
+# A JSON report with the per-target latency is written to stdout. The exit code is 0
+# if all targets became ready before the deadline, 1 otherwise.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_DEADLINE = 120
+INITIAL_BACKOFF = 0.05
+MAX_BACKOFF = 2.0
+CONNECT_TIMEOUT = 2.0
+
+# Default ports for each supported ATL_DB_TYPE
+JDBC_DEFAULT_PORTS = {
+    'postgresql': 5432,
+    'mysql': 3306,
+    'mariadb': 3306,
+    'sqlserver': 1433,
+    'oracle': 1521,
+    'h2': 9092,
+}
+
+
+def parse_hostport(hostport, default_port):
+    """
+    Split a 'host[:port]' string. IPv6 literals with a port must be bracketed; an unbracketed
+    IPv6 literal (more than one colon) is taken as the host alone.
+    Parameters:
+    - hostport (str): The host and optional port.
+    - default_port (int): The port to use if none is given.
+    Returns:
+    - tuple: A (host, port) tuple.
+    """
+    hostport = hostport.strip()
+    if hostport.count(':') > 1 and not hostport.startswith('['):
+        return hostport, default_port
+    m = re.match(r'^\[(?P<v6>[^\]]+)\](?::(?P<v6port>\d+))?$|^(?P<host>[^:]*)(?::(?P<port>\d+))?$', hostport)
+    if m is None:
+        raise ValueError(f"Cannot parse host and port from '{hostport}'")
+    host = m.group('v6') or m.group('host') or 'localhost'
+    port = m.group('v6port') or m.group('port') or default_port
+    return host, int(port)
+
+
+def parse_jdbc_url(url):
+    """
+    Extract the database server host and port from a JDBC URL.
+    Supports the URL formats of all database types supported by the images (PostgreSQL, MySQL,
+    SQL Server, Oracle and H2). Only the first host of a multi-host URL is returned.
+    Parameters:
+    - url (str): The JDBC URL, e.g. 'jdbc:postgresql://db:5432/bamboo'.
+    Returns:
+    - tuple: A (host, port) tuple, or None if the URL does not refer to a network server
+             (e.g. an embedded H2 database).
+    """
+    if not url.startswith('jdbc:'):
+        raise ValueError(f"Not a JDBC URL: '{url}'")
+    subprotocol = url[5:].split(':', 1)[0]
+
+    if subprotocol == 'oracle':
+        # jdbc:oracle:thin:@(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST=db)(PORT=1521))...)
+        host = re.search(r'\(\s*HOST\s*=\s*([^)\s]+)\s*\)', url, re.IGNORECASE)
+        if host:
+            port = re.search(r'\(\s*PORT\s*=\s*(\d+)\s*\)', url, re.IGNORECASE)
+            return host.group(1), int(port.group(1)) if port else JDBC_DEFAULT_PORTS['oracle']
+        # jdbc:oracle:thin:@//db:1521/service or jdbc:oracle:thin:@db:1521:SID
+        m = re.search(r'@(?://)?(\[[^\]]+\]|[^:/?]+)(?::(\d+))?', url)
+        if m is None:
+            raise ValueError(f"Cannot parse host from '{url}'")
+        return m.group(1).strip('[]'), int(m.group(2) or JDBC_DEFAULT_PORTS['oracle'])
+
+    if subprotocol == 'sqlserver':
+        # jdbc:sqlserver://db\instance:1433;databaseName=bamboo
+        if '//' not in url:
+            raise ValueError(f"Cannot parse host from '{url}'")
+        hostpart = url.split('//', 1)[1].split(';', 1)[0]
+        hostpart = re.sub(r'\\[^:]*', '', hostpart)
+        host, port = parse_hostport(hostpart, JDBC_DEFAULT_PORTS['sqlserver'])
+        if not hostpart:
+            # jdbc:sqlserver://;serverName=db;portNumber=1433
+            m = re.search(r';\s*serverName\s*=\s*([^;]+)', url, re.IGNORECASE)
+            host = m.group(1).strip() if m else host
+        m = re.search(r';\s*port(?:Number)?\s*=\s*(\d+)', url, re.IGNORECASE)
+        if m:
+            port = int(m.group(1))
+        return host, port
+
+    if subprotocol == 'h2':
+        # Only jdbc:h2:tcp:// and jdbc:h2:ssl:// are network servers
+        m = re.match(r'^jdbc:h2:(?:tcp|ssl)://([^/]+)', url)
+        if m is None:
+            return None
+        return parse_hostport(m.group(1), JDBC_DEFAULT_PORTS['h2'])
+
+    if subprotocol in JDBC_DEFAULT_PORTS:
+        # jdbc:postgresql://db1:5432,db2:5432/bamboo, jdbc:mysql:loadbalance://db:3306/bamboo
+        m = re.search(r'//([^/?;]+)', url)
+        if m is None:
+            return 'localhost', JDBC_DEFAULT_PORTS[subprotocol]
+        return parse_hostport(m.group(1).split(',')[0], JDBC_DEFAULT_PORTS[subprotocol])
+
+    raise ValueError(f"Unsupported JDBC subprotocol '{subprotocol}'")
+
+
+def parse_broker_uri(uri, default_port=54663):
+    """
+    Extract the address to check from an ActiveMQ broker URI such as 'nio://0.0.0.0:54663'.
+    Wildcard listen addresses are mapped to localhost.
+    Parameters:
+    - uri (str): The broker URI.
+    - default_port (int, optional): The port to use if none is given. Defaults to 54663.
+    Returns:
+    - tuple: A (host, port) tuple.
+    """
+    parts = urlsplit(uri)
+    host = parts.hostname
+    if host in (None, '', '0.0.0.0', '::'):
+        host = 'localhost'
+    return host, parts.port or default_port
+
+
+class Target:
+    """
+    A single readiness target. Subclasses implement `check()`, which raises on failure.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.ready = False
+        self.latency = None
+        self.attempts = 0
+        self.error = None
+
+    async def check(self):
+        raise NotImplementedError
+
+    def report(self):
+        return {
+            'name': self.name,
+            'ready': self.ready,
+            'latency': None if self.latency is None else round(self.latency, 3),
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+
+class TcpTarget(Target):
+    def __init__(self, name, host, port):
+        super().__init__(f'{name} ({host}:{port})')
+        self.host = host
+        self.port = port
+
+    async def check(self):
+        _, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        writer.close()
+
+
+class HttpTarget(Target):
+    def __init__(self, url, expected_status=200, expected_states=None):
+        super().__init__(f'http ({url})')
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 80
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.expected_status = expected_status
+        self.expected_states = expected_states
+
+    async def check(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        try:
+            # HTTP/1.0 so that the response is neither chunked nor kept alive
+            host = f'[{self.host}]' if ':' in self.host else self.host
+            writer.write(f'GET {self.path} HTTP/1.0\r\nHost: {host}:{self.port}\r\n'
+                         f'Accept: application/json\r\n\r\n'.encode('ascii'))
+            response = await asyncio.wait_for(reader.read(), CONNECT_TIMEOUT)
+        finally:
+            writer.close()
+
+        head, _, body = response.partition(b'\r\n\r\n')
+        status_line = head.split(b'\r\n', 1)[0].decode('iso-8859-1')
+        status = int(status_line.split()[1])
+        if status != self.expected_status:
+            raise ConnectionError(f'HTTP status {status}')
+        if self.expected_states:
+            data = json.loads(body.decode('utf-8'))
+            if not isinstance(data, dict):
+                raise ValueError('unexpected response')
+            state = data.get('state')
+            if state not in self.expected_states:
+                raise ConnectionError(f"state '{state}'")
+
+
+async def wait_target(target, start, deadline):
+    backoff = INITIAL_BACKOFF
+    while True:
+        target.attempts += 1
+        try:
+            await target.check()
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+            target.error = str(e) or type(e).__name__
+        else:
+            target.ready = True
+            target.error = None
+            target.latency = time.monotonic() - start
+            return
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        # Full jitter, so that many probes started together do not synchronise
+        await asyncio.sleep(min(random.uniform(0, backoff), remaining))
+        backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+async def wait_ready(targets, deadline=DEFAULT_DEADLINE):
+    """
+    Concurrently wait for all targets to become ready.
+    Parameters:
+    - targets (list): The Target instances to check.
+    - deadline (float, optional): The overall number of seconds to wait. Defaults to 120.
+    Returns:
+    - dict: A report containing the overall result, the elapsed time and the per-target results.
+    """
+    start = time.monotonic()
+    await asyncio.gather(*(wait_target(t, start, start + deadline) for t in targets))
+    return {
+        'ready': all(t.ready for t in targets),
+        'elapsed': round(time.monotonic() - start, 3),
+        'targets': [t.report() for t in targets],
+    }
+
+
+def build_targets(args):
+    targets = []
+    if args.jdbc is not None:
+        url = args.jdbc or os.environ.get('ATL_JDBC_URL')
+        if not url:
+            raise ValueError('--jdbc given without a URL and ATL_JDBC_URL is not set')
+        hostport = parse_jdbc_url(url)
+        if hostport is not None:
+            targets.append(TcpTarget('database', *hostport))
+    if args.broker is not None:
+        uri = args.broker or os.environ.get('ATL_BROKER_URI') or 'nio://0.0.0.0:54663'
+        targets.append(TcpTarget('broker', *parse_broker_uri(uri)))
+    for hostport in args.tcp:
+        targets.append(TcpTarget('tcp', *parse_hostport(hostport, 80)))
+    for url in args.http:
+        targets.append(HttpTarget(url, args.status, args.state))
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wait for one or more services to become ready.')
+    parser.add_argument('--jdbc', nargs='?', const='', default=None, metavar='URL',
+                        help='wait for the database server in the JDBC URL (default: $ATL_JDBC_URL)')
+    parser.add_argument('--broker', nargs='?', const='', default=None, metavar='URI',
+                        help='wait for the broker port (default: $ATL_BROKER_URI or nio://0.0.0.0:54663)')
+    parser.add_argument('--tcp', action='append', default=[], metavar='HOST:PORT',
+                        help='wait for a TCP port to accept connections (repeatable)')
+    parser.add_argument('--http', action='append', default=[], metavar='URL',
+                        help='wait for an HTTP endpoint to respond (repeatable)')
+    parser.add_argument('--status', type=int, default=200, help='expected HTTP status (default: 200)')
+    parser.add_argument('--state', action='append', default=None,
+                        help="expected value of the 'state' field in HTTP JSON responses (repeatable)")
+    parser.add_argument('-d', '--deadline', type=float, default=DEFAULT_DEADLINE,
+                        help=f'overall number of seconds to wait (default: {DEFAULT_DEADLINE})')
+    args = parser.parse_args()
+
+    try:
+        targets = build_targets(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = asyncio.run(wait_ready(targets, args.deadline))
+    print(json.dumps(report, indent=2))
+    return 0 if report['ready'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+# -------------------------------------------------------------------------------------
+# Resource watchdog for containerized Atlassian applications
+#
+# Samples the application JVM's CPU usage (/proc/<pid>/stat), thread count
+# (/proc/<pid>/status) and GC time (hsperfdata, see jvm_metrics.py) at a fixed interval.
+# When a threshold is breached for a number of consecutive intervals, diagnostics are
+# captured into $APP_HOME/diagnostics/<timestamp>/ without anyone having to be awake to
+# run thread-dumps.sh. For example:
+#
+#     $ docker exec -d my_bamboo /opt/atlassian/support/watchdog.py --cpu 300 --gc 25
+#
+# Captures are rate limited by -c/--cooldown, and the oldest captures are removed to keep
+# the diagnostics directory below -q/--quota. The watchdog exits with the JVM.
+#
+# NOTE: Thresholds are disabled by passing 0. CPU usage is a percentage of one core, as
+# reported by top.
+# -------------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from jvm_metrics import PerfData, SUPPORT_DIR, find_perfdata, get_jvm_pid
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+ACTIONS = ('threads', 'histogram', 'jfr')
+MAX_WAIT_DELAY = 16
+
+
+def get_app_home():
+    cmd = f'source {SUPPORT_DIR}/common.sh && get_app_home'
+    out = subprocess.run(['/bin/bash', '-c', cmd], stdout=subprocess.PIPE, check=True).stdout
+    return out.decode().strip()
+
+
+def read_cpu_seconds(pid):
+    """
+    Read the total user and system CPU time consumed by a process.
+    Parameters:
+    - pid (int): The process ID.
+    Returns:
+    - float: The CPU time in seconds.
+    """
+    with open(f'/proc/{pid}/stat', encoding='utf-8') as fd:
+        stat = fd.read()
+    # utime and stime are fields 14 and 15; the fields after the (possibly space-containing) command
+    # name start at field 3
+    fields = stat[stat.rfind(')') + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_threads(pid):
+    with open(f'/proc/{pid}/status', encoding='utf-8') as fd:
+        for line in fd:
+            if line.startswith('Threads:'):
+                return int(line.split()[1])
+    return None
+
+
+class Sampler:
+    """
+    Computes per-interval CPU and GC utilisation from the cumulative counters of a JVM.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        try:
+            self.perf = PerfData(find_perfdata(pid))
+        except (OSError, ValueError) as e:
+            print(f'GC time unavailable: {e}', file=sys.stderr)
+            self.perf = None
+        self.last = self.counters()
+
+    def counters(self):
+        if self.perf is not None:
+            self.perf.refresh()
+        return time.monotonic(), read_cpu_seconds(self.pid), self.perf.gc_time() if self.perf else None
+
+    def sample(self):
+        """
+        Returns:
+        - dict: CPU usage and GC time as percentages of the interval since the previous sample, and the
+          current thread count.
+        """
+        now, cpu, gc = self.counters()
+        last_now, last_cpu, last_gc = self.last
+        self.last = now, cpu, gc
+        elapsed = max(now - last_now, 1e-6)
+        return {
+            'cpu': round(100 * (cpu - last_cpu) / elapsed, 1),
+            'gc': None if gc is None else round(100 * (gc - last_gc) / elapsed, 1),
+            'threads': read_threads(self.pid),
+        }
+
+
+def breaches(sample, thresholds):
+    return [name for name, limit in thresholds.items()
+            if limit and sample.get(name) is not None and sample[name] >= limit]
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def enforce_quota(out_dir, quota, keep=None):
+    """
+    Remove the oldest captures until the diagnostics directory is below the quota.
+    Parameters:
+    - out_dir (str): The diagnostics directory, containing one subdirectory per capture.
+    - quota (int): The maximum size in bytes.
+    - keep (str, optional): A capture that must not be removed. Defaults to None.
+    """
+    captures = sorted(d for d in os.listdir(out_dir) if os.path.isdir(os.path.join(out_dir, d)))
+    sizes = {d: dir_size(os.path.join(out_dir, d)) for d in captures}
+    total = sum(sizes.values())
+    for capture in captures:
+        if total <= quota:
+            break
+        if capture == keep:
+            continue
+        print(f'Diagnostics quota exceeded; removing {capture}')
+        shutil.rmtree(os.path.join(out_dir, capture), ignore_errors=True)
+        total -= sizes[capture]
+    return total
+
+
+def jcmd(pid, *args, output=None):
+    cmd = [f"{os.environ.get('JAVA_HOME', '/usr')}/bin/jcmd", str(pid)] + list(args)
+    try:
+        with open(output or os.devnull, 'w', encoding='utf-8') as fd:
+            result = subprocess.run(cmd, stdout=fd, stderr=subprocess.STDOUT, timeout=120)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"jcmd {' '.join(args)} failed: {e}", file=sys.stderr)
+        return
+    if result.returncode != 0:
+        print(f"jcmd {' '.join(args)} failed with exit code {result.returncode}", file=sys.stderr)
+
+
+def capture(pid, out_dir, actions, reason, samples):
+    """
+    Capture diagnostics for an incident into a new timestamped directory under `out_dir`.
+    Returns:
+    - str: The name of the capture directory.
+    """
+    name = time.strftime('%Y-%m-%d_%H-%M-%S')
+    path = os.path.join(out_dir, name)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'watchdog.json'), 'w', encoding='utf-8') as fd:
+        json.dump({'pid': pid, 'reason': reason, 'samples': samples}, fd, indent=2)
+
+    if 'threads' in actions:
+        for i in range(3):
+            if i:
+                time.sleep(2)
+            jcmd(pid, 'Thread.print', '-l', output=os.path.join(path, f'threads.{int(time.time())}.txt'))
+    if 'histogram' in actions:
+        jcmd(pid, 'GC.class_histogram', output=os.path.join(path, 'class_histogram.txt'))
+    if 'jfr' in actions:
+        # Dumps the recording started via ATL_JFR_MODE, if any
+        jcmd(pid, 'JFR.dump', 'name=atlassian', f"filename={os.path.join(path, 'recording.jfr')}", 'maxage=10m')
+    return name
+
+
+def watch(pid, thresholds, interval, intervals, cooldown, out_dir, quota, actions, max_captures=None):
+    sampler = Sampler(pid)
+    recent = []
+    last_capture = None
+    captures = 0
+    while True:
+        time.sleep(interval)
+        try:
+            sample = sampler.sample()
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            print(f'Process {pid} has exited; watchdog stopping')
+            return 0
+
+        recent = (recent + [sample])[-intervals:]
+        breached = [breaches(s, thresholds) for s in recent]
+        if len(recent) < intervals or not all(breached):
+            continue
+        if last_capture is not None and time.monotonic() - last_capture < cooldown:
+            continue
+
+        reason = sorted(set().union(*breached))
+        print(f"Thresholds breached for {intervals} intervals ({', '.join(reason)}); capturing diagnostics")
+        os.makedirs(out_dir, exist_ok=True)
+        if enforce_quota(out_dir, quota) > quota:
+            print(f'Diagnostics directory {out_dir} is over quota; skipping capture', file=sys.stderr)
+        else:
+            name = capture(pid, out_dir, actions, reason, recent)
+            enforce_quota(out_dir, quota, keep=name)
+            print(f'Diagnostics have been written to {os.path.join(out_dir, name)}')
+        last_capture = time.monotonic()
+        recent = []
+        captures += 1
+        if max_captures is not None and captures >= max_captures:
+            return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture diagnostics when the JVM breaches resource thresholds.')
+    parser.add_argument('-p', '--pid', type=int, default=None, help='JVM PID (default: the application JVM)')
+    parser.add_argument('--cpu', type=float, default=0, help='CPU usage threshold in percent of one core')
+    parser.add_argument('--threads', type=int, default=0, help='thread count threshold')
+    parser.add_argument('--gc', type=float, default=0, help='threshold for the percentage of time spent in GC')
+    parser.add_argument('-i', '--interval', type=float, default=10, help='seconds between samples (default: 10)')
+    parser.add_argument('-n', '--intervals', type=int, default=3,
+                        help='consecutive intervals a threshold must be breached for (default: 3)')
+    parser.add_argument('-c', '--cooldown', type=float, default=1800,
+                        help='minimum number of seconds between captures (default: 1800)')
+    parser.add_argument('-a', '--action', action='append', choices=ACTIONS, default=None,
+                        help='diagnostics to capture; may be repeated (default: threads)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='diagnostics directory (default: $APP_HOME/diagnostics)')
+    parser.add_argument('-q', '--quota', type=int, default=1024, help='diagnostics quota in MiB (default: 1024)')
+    parser.add_argument('--max-captures', type=int, default=None, help='exit after this many captures')
+    parser.add_argument('-w', '--wait', type=float, default=300,
+                        help='seconds to wait for the application JVM to start (default: 300)')
+    args = parser.parse_args()
+    # Usually runs in the background with its output going to the container log
+    sys.stdout.reconfigure(line_buffering=True)
+
+    thresholds = {'cpu': args.cpu, 'threads': args.threads, 'gc': args.gc}
+    if not any(thresholds.values()):
+        parser.error('at least one of --cpu, --threads or --gc is required')
+
+    pid = args.pid
+    deadline = time.monotonic() + args.wait
+    delay = 1
+    while pid is None:
+        try:
+            pid = get_jvm_pid()
+        except (subprocess.CalledProcessError, ValueError):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print('Application JVM not found', file=sys.stderr)
+                return 1
+            # Until the pidfile is written, each lookup may fork jcmd, so back off while the JVM starts
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, MAX_WAIT_DELAY)
+
+    out_dir = args.output or os.path.join(get_app_home(), 'diagnostics')
+    print(f'Watching PID {pid}: ' + ', '.join(f'{k} >= {v}' for k, v in thresholds.items() if v) +
+          f' for {args.intervals} x {args.interval:g}s')
+    return watch(pid, thresholds, args.interval, args.intervals, args.cooldown, out_dir, args.quota * 1024 * 1024,
+                 args.action or ['threads'], args.max_captures)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
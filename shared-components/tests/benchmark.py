@@ -0,0 +1,105 @@
+import json
+import os
+import statistics
+import time
+
+from helpers import EXEC_LOG_PATTERN, get_bootstrap_proc, run_image, status_url, wait_for_http_response, \
+    wait_for_log, wait_for_proc, wait_for_state
+
+
+# Startup milestones, in the order they are reached
+PHASES = ['entrypoint_exec', 'jvm_start', 'status_ok', 'status_running']
+
+
+# Start a container from the image and record the time at which each startup milestone is reached, in
+# seconds since the container was requested. Milestones that are not reached within max_wait are None. The
+# application's HTTP port is published on an ephemeral host port.
+def measure_startup(docker_cli, image, port, running_state='RUNNING', max_wait=300, poll_interval=0.1, **kwargs):
+    start = time.monotonic()
+    host = run_image(docker_cli, image, ports={port: None}, **kwargs)
+    container = docker_cli.containers.get(host.backend.name)
+    url = status_url(container, port)
+    timings = dict.fromkeys(PHASES)
+
+    def elapsed():
+        return round(time.monotonic() - start, 3)
+
+    def remaining():
+        return max(max_wait - (time.monotonic() - start), 0)
+
+    try:
+        wait_for_log(container, EXEC_LOG_PATTERN, timeout=remaining())
+        timings['entrypoint_exec'] = elapsed()
+        wait_for_proc(host, get_bootstrap_proc(host), max_wait=remaining())
+        timings['jvm_start'] = elapsed()
+        wait_for_http_response(url, expected_status=200, max_wait=remaining(), interval=poll_interval)
+        timings['status_ok'] = elapsed()
+        wait_for_state(url, running_state, max_wait=remaining(), interval=poll_interval)
+        timings['status_running'] = elapsed()
+    except (TimeoutError, EOFError):
+        pass
+    finally:
+        container.remove(force=True)
+    return timings
+
+
+# Measure startup over a number of repetitions and summarise the results, alongside the product version
+# the image was built for.
+def run_benchmark(docker_cli, image, port, repetitions=5, **kwargs):
+    runs = [measure_startup(docker_cli, image, port, **kwargs) for _ in range(repetitions)]
+    median = {}
+    for phase in PHASES:
+        values = [run[phase] for run in runs if run[phase] is not None]
+        # A phase that did not complete in every run has no meaningful median
+        median[phase] = statistics.median(values) if len(values) == len(runs) else None
+    return {
+        'product_version': image.labels.get('product_version'),
+        'image': image.id,
+        'repetitions': repetitions,
+        'timestamp': int(time.time()),
+        'median': median,
+        'runs': runs,
+    }
+
+
+def save_results(results, path):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'w') as fd:
+        json.dump(results, fd, indent=2)
+
+
+def load_results(path):
+    with open(path) as fd:
+        return json.load(fd)
+
+
+# Compare the median timings with a baseline. Returns a list of (phase, baseline, current) for every gated
+# phase whose median is more than `threshold` (a fraction, e.g. 0.2 for 20%) slower than the baseline, or
+# that completed in the baseline but not in the current results.
+def find_regressions(results, baseline, threshold=0.2, phases=('status_running',)):
+    regressions = []
+    for phase in phases:
+        base = baseline['median'].get(phase)
+        current = results['median'].get(phase)
+        if base is None:
+            continue
+        if current is None or current > base * (1 + threshold):
+            regressions.append((phase, base, current))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = [f"Startup benchmark for version {results['product_version']} "
+             f"(median of {results['repetitions']} runs, seconds)"]
+    for phase in PHASES:
+        current = results['median'][phase]
+        line = f"  {phase:<16} {'-' if current is None else f'{current:8.3f}'}"
+        base = baseline['median'].get(phase) if baseline else None
+        if base is not None:
+            line += f"  baseline {base:8.3f} (version {baseline['product_version']})"
+            if current is not None and base > 0:
+                line += f"  {100 * (current - base) / base:+.1f}%"
+        lines.append(line)
+    return '\n'.join(lines)
@@ -1,3 +1,3 @@
 import pytest
 
-from fixtures import docker_cli, image, run_user
\ No newline at end of file
+from fixtures import container_pool, docker_cli, image, run_user
\ No newline at end of file
@@ -1,9 +1,18 @@
 import pytest
 
+import fcntl
+import fnmatch
+import functools
+import hashlib
+import json
 import os
+import subprocess
+import uuid
 
 import docker
+import docker.models.containers
 import requests
+import testinfra
 
 
 DOCKERFILE = os.environ.get('DOCKERFILE') or 'Dockerfile'
@@ -11,6 +20,11 @@ DOCKERFILE_BUILDARGS = os.environ.get('DOCKERFILE_BUILDARGS')
 DOCKERFILE_VERSION_ARG = os.environ.get('DOCKERFILE_VERSION_ARG')
 MAC_PRODUCT_KEY = os.environ.get('MAC_PRODUCT_KEY') or 'docker-testapp'
 APP_TEST_VERSION = os.environ.get('APP_TEST_VERSION') # Optional override
+POOL_LABEL = 'atl.test.pool'
+WORKER_LABEL = 'atl.test.worker'
+DIGEST_LABEL = 'atl.test.context-digest'
+TEST_CACHE_DIR = os.environ.get('TEST_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'atl-docker-tests')
+CONTEXT_IGNORE = ['.git', '*/__pycache__', '__pycache__', '.pytest_cache', '*.pyc']
 
 
 def parse_buildargs(buildargs):
@@ -19,41 +33,175 @@ def parse_buildargs(buildargs):
     return dict(item.split("=") for item in buildargs.split(","))
 
 
-def make_image():
-    buildargs = parse_buildargs(DOCKERFILE_BUILDARGS)
+# Resolve the version of the product to test, once per session. The latest Marketplace version is cached
+# on disk so that a previously resolved version can be reused when offline.
+@functools.lru_cache(maxsize=None)
+def get_product_version():
     if APP_TEST_VERSION:
-        buildargs[DOCKERFILE_VERSION_ARG] = APP_TEST_VERSION
-    elif MAC_PRODUCT_KEY != 'docker-testapp':
-        r = requests.get(f'https://marketplace.atlassian.com/rest/2/products/key/{MAC_PRODUCT_KEY}/versions/latest')
+        return APP_TEST_VERSION
+    cache_file = os.path.join(TEST_CACHE_DIR, 'product-versions.json')
+    try:
+        with open(cache_file) as fd:
+            cache = json.load(fd)
+    except (OSError, ValueError):
+        cache = {}
+    try:
+        r = requests.get(f'https://marketplace.atlassian.com/rest/2/products/key/{MAC_PRODUCT_KEY}/versions/latest',
+                         timeout=30)
+        r.raise_for_status()
         version = r.json().get('name')
-        buildargs[DOCKERFILE_VERSION_ARG] = version
+    except (requests.exceptions.RequestException, ValueError):
+        if MAC_PRODUCT_KEY not in cache:
+            raise
+        return cache[MAC_PRODUCT_KEY]
+    cache[MAC_PRODUCT_KEY] = version
+    os.makedirs(TEST_CACHE_DIR, exist_ok=True)
+    with open(cache_file, 'w') as fd:
+        json.dump(cache, fd)
+    return version
+
+
+def read_dockerignore(path):
+    try:
+        with open(os.path.join(path, '.dockerignore')) as fd:
+            patterns = [line.strip() for line in fd]
+    except OSError:
+        patterns = []
+    return [p.strip('/') for p in patterns if p and not p.startswith('#')] + CONTEXT_IGNORE
+
+
+# Digest of everything that determines the built image: the Dockerfile, the build arguments and the content
+# of the build context
+def context_digest(path, dockerfile, buildargs):
+    ignore = read_dockerignore(path)
+    digest = hashlib.sha256()
+    digest.update(dockerfile.encode())
+    digest.update(json.dumps(buildargs, sort_keys=True).encode())
+    for root, dirs, files in os.walk(path):
+        rel_root = os.path.relpath(root, path)
+        dirs[:] = sorted(d for d in dirs
+                         if not any(fnmatch.fnmatch(os.path.normpath(os.path.join(rel_root, d)), p) for p in ignore))
+        for name in sorted(files):
+            rel = os.path.normpath(os.path.join(rel_root, name))
+            if any(fnmatch.fnmatch(rel, p) for p in ignore):
+                continue
+            full = os.path.join(root, name)
+            digest.update(f'{rel}\0{os.lstat(full).st_mode}\0'.encode())
+            if os.path.islink(full):
+                digest.update(os.readlink(full).encode())
+            else:
+                with open(full, 'rb') as fd:
+                    for chunk in iter(lambda: fd.read(1 << 20), b''):
+                        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Builds the image once per session, and reuses an existing local image if it was built from identical
+# inputs
+@functools.lru_cache(maxsize=None)
+def make_image():
+    buildargs = parse_buildargs(DOCKERFILE_BUILDARGS)
+    if APP_TEST_VERSION or MAC_PRODUCT_KEY != 'docker-testapp':
+        buildargs[DOCKERFILE_VERSION_ARG] = get_product_version()
     docker_cli = docker.from_env()
     tag = ''.join(ch for ch in DOCKERFILE if ch.isalnum())
-    image = docker_cli.images.build(path='.',
-                                    tag=f'{MAC_PRODUCT_KEY}:{tag}'.lower(),
-                                    labels={"product_version": buildargs[DOCKERFILE_VERSION_ARG]},
-                                    buildargs=buildargs,
-                                    dockerfile=DOCKERFILE,
-                                    rm=True)[0]
+    tag = f'{MAC_PRODUCT_KEY}:{tag}'.lower()
+    digest = context_digest('.', DOCKERFILE, buildargs)
+    # Parallel pytest-xdist workers build one at a time, so all but the first reuse its image
+    os.makedirs(TEST_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(TEST_CACHE_DIR, 'build.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            image = docker_cli.images.get(tag)
+            if image.labels.get(DIGEST_LABEL) == digest:
+                return image
+        except docker.errors.ImageNotFound:
+            pass
+        # Built with the CLI, as the Dockerfiles use BuildKit features that the API's builder lacks
+        cmd = ['docker', 'build', '--tag', tag, '--file', DOCKERFILE,
+               '--label', f'product_version={buildargs[DOCKERFILE_VERSION_ARG]}',
+               '--label', f'{DIGEST_LABEL}={digest}']
+        for k, v in buildargs.items():
+            cmd += ['--build-arg', f'{k}={v}']
+        subprocess.run(cmd + ['.'], check=True, env=dict(os.environ, DOCKER_BUILDKIT='1'))
+        image = docker_cli.images.get(tag)
     return image
 
 
 def get_run_user():
     i = make_image()
-    image_env = {k:v for k,v in (x.split('=') for x in i.attrs['ContainerConfig']['Env'])}
+    # ContainerConfig is not populated for images built with BuildKit
+    image_env = {k:v for k,v in (x.split('=', 1) for x in i.attrs['Config']['Env'])}
     run_user = f'{image_env["RUN_UID"]}:{image_env["RUN_GID"]}'
     return run_user
 
 
+# Hands out running containers, reusing one for every request with the same image and run arguments. Only
+# use this for tests that do not modify the container or depend on it being freshly started.
+# The least recently used container is removed when the pool is full.
+class ContainerPool:
+    def __init__(self, docker_cli, size=2):
+        self.docker_cli = docker_cli
+        self.size = size
+        self.containers = {}
+
+    def get(self, image, **kwargs):
+        key = (image.id, json.dumps(kwargs, sort_keys=True, default=str))
+        container = self.containers.pop(key, None)
+        if container is not None:
+            container.reload()
+            if container.status != 'running':
+                container.remove(force=True)
+                container = None
+        if container is None:
+            while len(self.containers) >= self.size:
+                self.containers.pop(next(iter(self.containers))).remove(force=True)
+            labels = dict(kwargs.pop('labels', {}), **{POOL_LABEL: 'true'})
+            container = self.docker_cli.containers.run(image, detach=True, labels=labels, **kwargs)
+        self.containers[key] = container
+        return testinfra.get_host("docker://" + container.id)
+
+    def close(self):
+        for container in self.containers.values():
+            container.remove(force=True)
+        self.containers.clear()
+
+
+def worker_id():
+    return os.environ.get('PYTEST_XDIST_WORKER') or 'main'
+
+
+# Labels and names every container after the pytest-xdist worker that started it, so that each worker only
+# cleans up its own containers
+class WorkerContainerCollection(docker.models.containers.ContainerCollection):
+    def run(self, image, command=None, **kwargs):
+        kwargs['labels'] = dict(kwargs.get('labels') or {}, **{WORKER_LABEL: worker_id()})
+        kwargs.setdefault('name', f'{MAC_PRODUCT_KEY}-test-{worker_id()}-{uuid.uuid4().hex[:8]}')
+        return super().run(image, command, **kwargs)
+
+
+class WorkerDockerClient(docker.DockerClient):
+    @property
+    def containers(self):
+        return WorkerContainerCollection(client=self)
+
+
 # This fixture returns a temporary Docker CLI that cleans up running test containers after each test
 @pytest.fixture
 def docker_cli():
-    docker_cli = docker.from_env()
+    docker_cli = WorkerDockerClient.from_env()
     yield docker_cli
-    for container in docker_cli.containers.list():
-        for tag in container.image.tags:
-            if tag.startswith(MAC_PRODUCT_KEY):
-                container.remove(force=True)
+    for container in docker_cli.containers.list(all=True, filters={'label': f'{WORKER_LABEL}={worker_id()}'}):
+        if POOL_LABEL not in container.labels:
+            container.remove(force=True)
+
+
+# This fixture returns a pool of containers that are shared between the tests of a module
+@pytest.fixture(scope='module')
+def container_pool():
+    pool = ContainerPool(WorkerDockerClient.from_env())
+    yield pool
+    pool.close()
 
 
 # This fixture returns an image for the Docker build being tested
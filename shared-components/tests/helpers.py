@@ -4,9 +4,15 @@ import re
 import time
 import xml.etree.ElementTree as etree
 
+import docker
 import requests
 import testinfra
 
+# Logged by the entrypoint immediately before it execs the application
+EXEC_LOG_PATTERN = r'Running .+ with command'
+
+INITIAL_POLL_INTERVAL = 0.05
+
 
 # Helper functions to get config values from support scripts
 def get_app_home(container):
@@ -30,11 +36,46 @@ def run_image(docker_cli, image, **kwargs):
     container = docker_cli.containers.run(image, detach=True, **kwargs)
     return testinfra.get_host("docker://"+container.id)
 
+# Return the Docker SDK container behind a TestInfra host
+def get_container(container):
+    return docker.from_env().containers.get(container.backend.name)
+
+# Return the host port that a container port is published on. Publish ports as {port: None} to have Docker
+# assign a free ephemeral host port, so that tests do not collide with each other or anything else on the host.
+def get_host_port(container, port=None):
+    if hasattr(container, 'backend'):
+        container = get_container(container)
+    else:
+        container.reload()
+    ports = container.attrs['NetworkSettings']['Ports'] or {}
+    published = {k: v for k, v in ports.items() if v}
+    if port is None:
+        if len(published) != 1:
+            raise ValueError(f'Expected exactly one published port, found {sorted(published)}')
+        bindings = next(iter(published.values()))
+    else:
+        bindings = published.get(f'{port}/tcp')
+        if not bindings:
+            raise ValueError(f'Port {port} is not published')
+    return int(bindings[0]['HostPort'])
+
+def status_url(container, port=None, path='/status'):
+    return f'http://localhost:{get_host_port(container, port)}{path}'
+
 # TestInfra's process command doesn't seem to work for arg matching
 def get_procs(container):
     ps = container.run('ps -axo args')
     return ps.stdout.split('\n')
 
+# List the container's processes from the Docker daemon, which is much cheaper than exec'ing ps in the
+# container. Falls back to get_procs() where the daemon cannot list processes.
+def get_top_procs(container):
+    try:
+        top = get_container(container).top(ps_args='-eo pid,args')
+    except docker.errors.APIError:
+        return get_procs(container)
+    return [p[-1] for p in top.get('Processes') or []]
+
 def parse_properties(container, properties):
     properties_raw = container.file(properties).content
     properties_str = properties_raw.decode().strip().split('\n')
@@ -43,14 +84,30 @@ def parse_properties(container, properties):
 def parse_xml(container, xml):
     return etree.fromstring(container.file(xml).content)
 
+# Rather than polling from the start, block on the container's log stream until the entrypoint has exec'd
+# the application (or the container exits), then poll the process list with a short backoff.
 def wait_for_proc(container, proc_str, max_wait=10):
-    waited = 0
-    while waited < max_wait:
-        procs = list(filter(lambda p: proc_str in p, get_procs(container)))
-        if len(procs) > 0:
-            return procs[0]
-        time.sleep(0.1)
-        waited += 0.1
+    timeout = time.time() + max_wait
+
+    def find_proc():
+        procs = [p for p in get_top_procs(container) if proc_str in p]
+        return procs[0] if procs else None
+
+    proc = find_proc()
+    if proc is not None:
+        return proc
+    try:
+        wait_for_log(get_container(container), EXEC_LOG_PATTERN, timeout=max(timeout - time.time(), 0.1))
+    except EOFError:
+        raise TimeoutError("Container exited before starting the target process")
+
+    delay = INITIAL_POLL_INTERVAL
+    while time.time() < timeout:
+        proc = find_proc()
+        if proc is not None:
+            return proc
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
 
     raise TimeoutError("Failed to find target process")
 
@@ -64,8 +121,10 @@ def wait_for_file(container, path, max_wait=10):
 
     raise TimeoutError("Failed to find target process")
 
-def wait_for_http_response(url, expected_status=200, expected_state=None, max_wait=20):
+# Poll with an exponential backoff, starting at INITIAL_POLL_INTERVAL and capped at `interval` seconds
+def wait_for_http_response(url, expected_status=200, expected_state=None, max_wait=20, interval=1):
     timeout = time.time() + max_wait
+    delay = min(INITIAL_POLL_INTERVAL, interval)
     while time.time() < timeout:
         try:
             r = requests.get(url)
@@ -77,11 +136,13 @@ def wait_for_http_response(url, expected_status=200, expected_state=None, max_wa
                     state = r.json().get('state')
                     assert state in expected_state
                 return
-        time.sleep(1)
+        time.sleep(delay)
+        delay = min(delay * 2, interval)
     raise TimeoutError
 
-def wait_for_state(url, expected_state, max_wait=300):
+def wait_for_state(url, expected_state, max_wait=300, interval=1):
     timeout = time.time() + max_wait
+    delay = min(INITIAL_POLL_INTERVAL, interval)
     while time.time() < timeout:
         try:
             r = requests.get(url)
@@ -95,7 +156,8 @@ def wait_for_state(url, expected_state, max_wait=300):
                     return
             except:
                 pass
-        time.sleep(1)
+        time.sleep(delay)
+        delay = min(delay * 2, interval)
     raise TimeoutError
 
 def wait_for_log(container, pattern, timeout=120):
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import math
+import time
+import urllib.parse
+
+from helpers import status_url, wait_for_http_response
+
+
+# Drive HTTP load against a running container, to compare connector settings (threads, accept count,
+# compression, protocol) with reproducible numbers. Requests are made over raw asyncio streams so that a
+# single process can sustain hundreds of concurrent connections, either reusing each connection
+# (keep-alive) or opening a new one per request.
+
+
+REQUEST_TIMEOUT = 30
+
+
+class HttpError(Exception):
+    pass
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise HttpError('Connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+    return status, headers
+
+
+class Connection:
+    def __init__(self, host, port, keep_alive, compression):
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self.compression = compression
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        headers = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                   f"Connection: {'keep-alive' if self.keep_alive else 'close'}"]
+        if self.compression:
+            headers.append('Accept-Encoding: gzip')
+        self.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        try:
+            status, headers = await read_response(self.reader)
+        except BaseException:
+            await self.close()
+            raise
+        if not self.keep_alive or headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+
+async def client(host, port, paths, keep_alive, compression, deadline, latencies, errors):
+    conn = Connection(host, port, keep_alive, compression)
+    i = 0
+    try:
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.monotonic()
+            try:
+                status = await asyncio.wait_for(conn.request(path), REQUEST_TIMEOUT)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, HttpError, ValueError,
+                    IndexError) as e:
+                await conn.close()
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            if status >= 400:
+                errors[f'HTTP {status}'] = errors.get(f'HTTP {status}', 0) + 1
+            else:
+                latencies.append(time.monotonic() - start)
+    finally:
+        await conn.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+async def run_load(host, port, paths, concurrency=50, duration=30, keep_alive=True, compression=False):
+    """
+    Run `concurrency` clients in a closed loop for `duration` seconds and summarise the results.
+    """
+    latencies = []
+    errors = {}
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, paths, keep_alive, compression, deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    total = len(latencies) + sum(errors.values())
+    return {
+        'requests': total,
+        'throughput': round(len(latencies) / elapsed, 1),
+        'latency_ms_p50': round(1000 * percentile(latencies, 50), 2) if latencies else None,
+        'latency_ms_p90': round(1000 * percentile(latencies, 90), 2) if latencies else None,
+        'latency_ms_p99': round(1000 * percentile(latencies, 99), 2) if latencies else None,
+        'latency_ms_max': round(1000 * latencies[-1], 2) if latencies else None,
+        'error_rate': round(sum(errors.values()) / total, 4) if total else None,
+        'errors': errors,
+    }
+
+
+# Start a container for each named configuration (a dict of environment variables), wait for it to serve
+# requests, and run the load against it with and without keep-alive. Returns a list of result rows.
+def compare_configurations(docker_cli, image, port, configurations, paths, concurrency=50, duration=30,
+                           warmup=5, max_wait=300):
+    rows = []
+    for name, environment in configurations.items():
+        container = docker_cli.containers.run(image, detach=True, environment=environment, ports={port: None})
+        try:
+            url = status_url(container, port)
+            wait_for_http_response(url, expected_status=200, max_wait=max_wait)
+            host, host_port = urllib.parse.urlsplit(url).hostname, urllib.parse.urlsplit(url).port
+            compression = environment.get('ATL_TOMCAT_COMPRESSION', 'off') not in ('off', '0')
+            for keep_alive in (True, False):
+                if warmup:
+                    asyncio.run(run_load(host, host_port, paths, concurrency, warmup, keep_alive, compression))
+                result = asyncio.run(run_load(host, host_port, paths, concurrency, duration, keep_alive,
+                                              compression))
+                rows.append(dict(result, configuration=name, keep_alive=keep_alive))
+        finally:
+            container.remove(force=True)
+    return rows
+
+
+TABLE_COLUMNS = [
+    ('configuration', 'Configuration'),
+    ('keep_alive', 'Keep-alive'),
+    ('requests', 'Requests'),
+    ('throughput', 'Req/s'),
+    ('latency_ms_p50', 'p50 ms'),
+    ('latency_ms_p90', 'p90 ms'),
+    ('latency_ms_p99', 'p99 ms'),
+    ('latency_ms_max', 'max ms'),
+    ('error_rate', 'Errors'),
+]
+
+
+def format_table(rows):
+    cells = [[title for _, title in TABLE_COLUMNS]]
+    for row in rows:
+        cells.append(['-' if row.get(key) is None else str(row.get(key)) for key, _ in TABLE_COLUMNS])
+    widths = [max(len(r[i]) for r in cells) for i in range(len(TABLE_COLUMNS))]
+    lines = [' | '.join(c.ljust(w) if i < 2 else c.rjust(w) for i, (c, w) in enumerate(zip(r, widths)))
+             for r in cells]
+    lines.insert(1, '-+-'.join('-' * w for w in widths))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run HTTP load against an already running application.')
+    parser.add_argument('url', help='base URL, e.g. http://localhost:8085')
+    parser.add_argument('-p', '--path', action='append', default=None,
+                        help='path to request; may be repeated (default: /status)')
+    parser.add_argument('-c', '--concurrency', type=int, default=50, help='concurrent clients (default: 50)')
+    parser.add_argument('-d', '--duration', type=float, default=30, help='seconds per run (default: 30)')
+    parser.add_argument('--compression', action='store_true', help='send Accept-Encoding: gzip')
+    args = parser.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    prefix = url.path.rstrip('/')
+    paths = [prefix + p for p in (args.path or ['/status'])]
+    rows = []
+    for keep_alive in (True, False):
+        result = asyncio.run(run_load(url.hostname, url.port or 80, paths, args.concurrency, args.duration,
+                                      keep_alive, args.compression))
+        rows.append(dict(result, configuration=args.url, keep_alive=keep_alive))
+    print(format_table(rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
+import json
 import pytest
+import re
+import time
 
-from helpers import get_app_home, get_bootstrap_proc, run_image, wait_for_proc
+from helpers import get_app_home, get_bootstrap_proc, get_container, run_image, wait_for_proc
 
 
 def test_thread_dumps(docker_cli, image, run_user):
@@ -79,8 +82,8 @@ def test_heap_dump_overwrite_true(docker_cli, image, run_user):
     assert heap_dump_1 != heap_dump_2
 
 
-def test_app_name_set(docker_cli, image, run_user):
-    container = run_image(docker_cli, image, user=run_user)
+def test_app_name_set(container_pool, image, run_user):
+    container = container_pool.get(image, user=run_user)
     wait_for_proc(container, get_bootstrap_proc(container))
 
     name = container.run('echo $APP_NAME').stdout.strip()
@@ -88,8 +91,8 @@ def test_app_name_set(docker_cli, image, run_user):
     assert name is not None and name != ""
 
 
-def test_pidfile_set(docker_cli, image, run_user):
-    container = run_image(docker_cli, image, user=run_user)
+def test_pidfile_set(container_pool, image, run_user):
+    container = container_pool.get(image, user=run_user)
     wait_for_proc(container, get_bootstrap_proc(container))
 
     pidfile = f"{get_app_home(container)}/docker-app.pid"
@@ -97,3 +100,130 @@ def test_pidfile_set(docker_cli, image, run_user):
 
     pid = container.run(f"cat {pidfile}").stdout.strip()
     assert int(pid) > 1
+
+
+def test_wait_pid(docker_cli, image, run_user):
+    container = run_image(docker_cli, image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    pid = container.check_output('/bin/bash -c "sleep 2 > /dev/null 2>&1 & echo \\$!"')
+    out = container.check_output(f'/opt/atlassian/support/wait-pid.sh {pid}')
+    assert f'Process {pid} exited after' in out
+
+    timeout = container.run('/opt/atlassian/support/wait_pid.py --timeout 0.5 1')
+    assert timeout.rc == 1
+
+
+def test_wait_ready(container_pool, image, run_user):
+    container = container_pool.get(image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    cmd = '/opt/atlassian/support/wait_ready.py --tcp localhost:1 --jdbc jdbc:h2:/tmp/db --deadline 1'
+    result = container.run(cmd)
+    assert result.rc == 1
+
+    report = json.loads(result.stdout)
+    assert report['ready'] is False
+    assert len(report['targets']) == 1
+    assert report['targets'][0]['name'] == 'tcp (localhost:1)'
+    assert report['targets'][0]['attempts'] > 1
+
+
+def test_jvm_pid_resolution(docker_cli, image, run_user):
+    container = run_image(docker_cli, image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    cmd = "/bin/bash -c 'source /opt/atlassian/support/common.sh && echo ${JVM_APP_PID}'"
+    jvm_pid = container.check_output(cmd)
+    jcmd_cmd = f"/bin/bash -c '${{JAVA_HOME}}/bin/jcmd | grep {get_bootstrap_proc(container)} | cut -d\" \" -f1'"
+    assert jvm_pid == container.check_output(jcmd_cmd)
+
+    # Without the entrypoint's pidfile the JVM is found by scanning /proc, and the result is cached
+    cache = '/tmp/.bamboo-jvm.pid'
+    container.run(f'mv {get_app_home(container)}/docker-app.pid /tmp/docker-app.pid.bak')
+    traced_cmd = "/bin/bash -xc 'source /opt/atlassian/support/common.sh && echo ${JVM_APP_PID}'"
+    scan = container.run(traced_cmd)
+    assert scan.stdout.strip() == jvm_pid
+    assert 'find_app_jvm' in scan.stderr
+    assert container.check_output(f'cat {cache}') == jvm_pid
+
+    # Subsequent lookups are served from the cache
+    cached = container.run(traced_cmd)
+    assert cached.stdout.strip() == jvm_pid
+    assert 'find_app_jvm' not in cached.stderr
+
+
+def test_jvm_metrics(container_pool, image, run_user):
+    container = container_pool.get(image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    metrics = container.check_output('/opt/atlassian/support/jvm_metrics.py')
+    assert '# TYPE jvm_gc_collections_total counter' in metrics
+    assert re.search(r'^jvm_threads_live \d+$', metrics, re.MULTILINE)
+    assert re.search(r'^jvm_classes_loaded_total \d+$', metrics, re.MULTILINE)
+
+
+def test_watchdog(docker_cli, image, run_user):
+    container = run_image(docker_cli, image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    # Any running JVM has more than one thread, so this captures on the first full window
+    out = container.check_output('/opt/atlassian/support/watchdog.py --threads 1 --interval 1 --intervals 2 '
+                                 '--action threads --action histogram --max-captures 1')
+    assert 'Thresholds breached for 2 intervals (threads)' in out
+
+    diagnostics = f'{get_app_home(container)}/diagnostics'
+    assert len(container.check_output(f'find {diagnostics} -name "threads.*.txt"').splitlines()) == 3
+    assert container.run(f'find {diagnostics} -name class_histogram.txt -size +0').stdout.strip()
+
+    report = json.loads(container.check_output(f'cat {diagnostics}/*/watchdog.json'))
+    assert report['reason'] == ['threads']
+    assert all(s['threads'] > 1 for s in report['samples'])
+
+
+def test_home_usage(docker_cli, image, run_user):
+    container = run_image(docker_cli, image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    home = get_app_home(container)
+    container.run('mkdir -p /tmp/home/xml-data/builds/PROJ-PLAN-JOB1/download-data/build_logs /tmp/home/artifacts')
+    container.run('head -c 10000 /dev/zero > /tmp/home/xml-data/builds/PROJ-PLAN-JOB1/download-data/build_logs/1.log')
+
+    report = json.loads(container.check_output('/opt/atlassian/support/home_usage.py /tmp/home'))
+    assert report['totals']['files'] == 1
+    assert report['areas']['build-logs']['bytes'] == 10000
+    assert report['plans'] == {'PROJ-PLAN': report['areas']['build-logs']}
+
+    report = json.loads(container.check_output('/opt/atlassian/support/home_usage.py'))
+    assert report['home'] == home
+    assert report['totals']['files'] > 0
+
+
+def test_health_probe(docker_cli, image, run_user):
+    container = run_image(docker_cli, image, user=run_user)
+    wait_for_proc(container, get_bootstrap_proc(container))
+
+    # A stand-in status endpoint whose state can be changed between probes
+    container.run('mkdir -p /tmp/fake-status && printf \'{"state": "FIRST_RUN"}\' > /tmp/fake-status/status')
+    get_container(container).exec_run('python3 -m http.server 8099 --bind 127.0.0.1 --directory /tmp/fake-status',
+                                      detach=True)
+    probe = '/opt/atlassian/support/health_probe.py --url http://localhost:8099/status'
+    for _ in range(50):
+        if container.run(f'{probe} --ttl 0').rc == 3:
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail('Fake status endpoint did not come up')
+
+    # The state was fetched and cached above, so a probe within the TTL does not see the change
+    container.run('printf \'{"state": "RUNNING"}\' > /tmp/fake-status/status')
+    cached = container.run(f'{probe} --ttl 600')
+    assert cached.rc == 3
+    assert cached.stdout.strip() == 'FIRST_RUN'
+    assert container.run(f'{probe} --ttl 600 --accept FIRST_RUN').rc == 0
+    assert container.run(f'{probe} --ttl 0').rc == 0
+
+    # The cache is keyed by URL, so another URL is probed itself
+    unreachable = container.run('/opt/atlassian/support/health_probe.py --url http://localhost:1/status --ttl 600')
+    assert unreachable.rc == 1
+    assert unreachable.stdout.startswith('unreachable')
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+##############################################################################
+#
+# Orderly shutdown of Bamboo, in bounded phases:
+#
+#   1. drain - put the server into "prepare for restart" mode, so that no
+#      new builds are started, and wait for running builds to finish
+#   2. stop  - ask Tomcat to stop via stop-bamboo.sh
+#   3. exit  - wait for the JVM to exit
+#   4. kill  - kill the JVM if it is still running once the budget is spent
+#
+# The time available for each phase is derived from the orchestrator's
+# grace period, which should be set to the same value as the pod's
+# `terminationGracePeriodSeconds` via ATL_SHUTDOWN_GRACE_PERIOD. Draining
+# gets whatever is left once the stop budget and a safety margin have been
+# reserved. A JSON report with per-phase timings is printed on completion.
+#
+# Draining requires an admin personal access token in
+# ATL_SHUTDOWN_DRAIN_TOKEN; without it the drain phase is skipped.
+#
+##############################################################################
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+
+sys.path.append('/opt/atlassian/support')
+from wait_pid import wait_pid  # noqa: E402
+
+BAMBOO_INSTALL_DIR = os.environ['BAMBOO_INSTALL_DIR']
+BAMBOO_HOME = os.environ['BAMBOO_HOME']
+RUN_USER = os.environ['RUN_USER']
+
+SAFETY_MARGIN = 5
+DRAIN_POLL_INTERVAL = 2
+READY_STATES = ('READY_FOR_RESTART', 'PAUSED')
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else float(value)
+
+
+def setup_complete():
+    try:
+        cfg = ET.parse(f'{BAMBOO_HOME}/bamboo.cfg.xml')
+    except (OSError, ET.ParseError):
+        return False
+    return (cfg.findtext('setupType') or '').strip() == 'complete'
+
+
+def base_url():
+    port = os.environ.get('ATL_TOMCAT_PORT') or '8085'
+    context = os.environ.get('ATL_TOMCAT_CONTEXTPATH') or os.environ.get('CATALINA_CONTEXT_PATH') or ''
+    return f"http://localhost:{port}{context.rstrip('/')}"
+
+
+def server_request(path, token, method='GET'):
+    req = urllib.request.Request(f'{base_url()}/rest/api/latest/server{path}', method=method,
+                                 headers={'Authorization': f'Bearer {token}', 'Accept': 'application/json'})
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        body = resp.read()
+    return json.loads(body) if body else {}
+
+
+def drain(token, budget):
+    """
+    Put the server into "prepare for restart" mode and wait for running builds to finish.
+    Returns the result of the phase as a string.
+    """
+    if not token:
+        return 'skipped (ATL_SHUTDOWN_DRAIN_TOKEN not set)'
+    if budget <= 0:
+        return 'skipped (no time budget)'
+
+    deadline = time.monotonic() + budget
+    try:
+        server_request('/prepareForRestart', token, method='POST')
+        while True:
+            state = server_request('', token).get('state')
+            if state in READY_STATES:
+                return f'drained ({state})'
+            if time.monotonic() + DRAIN_POLL_INTERVAL > deadline:
+                return f'timed out ({state})'
+            time.sleep(DRAIN_POLL_INTERVAL)
+    except (OSError, ValueError) as e:
+        return f'failed ({e})'
+
+
+def stop_tomcat(pid, timeout):
+    with open(f'{BAMBOO_INSTALL_DIR}/work/catalina.pid', 'w', encoding='utf-8') as fd:
+        fd.write(str(pid))
+    env = dict(os.environ, CATALINA_PID=f'{BAMBOO_INSTALL_DIR}/work/catalina.pid')
+    cmd = [f'{BAMBOO_INSTALL_DIR}/bin/stop-bamboo.sh']
+    if os.getuid() == 0:
+        cmd = ['/bin/su', RUN_USER, '-c', cmd[0]]
+    # In its own session, so that stop-bamboo.sh and its children can be killed with su on timeout
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, start_new_session=True)
+    try:
+        rc = proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+        return 'timed out'
+    return 'stopped' if rc == 0 else f'stop-bamboo.sh exited with {rc}'
+
+
+def kill_jvm(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+        wait_pid(pid, SAFETY_MARGIN)
+    except ProcessLookupError:
+        return 'exited'
+    except (PermissionError, TimeoutError) as e:
+        return f'failed ({e or type(e).__name__})'
+    return 'killed'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drain builds and shut down Bamboo.')
+    # shutdown-wait.sh passes no PID if the JVM is not running
+    parser.add_argument('pid', type=int, nargs='?', default=None, help='PID of the Bamboo JVM')
+    parser.add_argument('--grace-period', type=float, default=env_float('ATL_SHUTDOWN_GRACE_PERIOD', 30),
+                        help='total shutdown budget in seconds; match terminationGracePeriodSeconds (default: 30)')
+    parser.add_argument('--stop-budget', type=float, default=env_float('ATL_SHUTDOWN_STOP_BUDGET', 20),
+                        help='seconds reserved for stopping Tomcat and the JVM exiting (default: 20)')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    phases = []
+
+    def phase(name, fn, *fn_args):
+        print(f"Shutdown phase '{name}'...", flush=True)
+        phase_start = time.monotonic()
+        result = fn(*fn_args)
+        elapsed = time.monotonic() - phase_start
+        phases.append({'phase': name, 'seconds': round(elapsed, 3), 'result': result})
+        print(f"Shutdown phase '{name}': {result} after {elapsed:.3f}s", flush=True)
+
+    def remaining():
+        return args.grace_period - SAFETY_MARGIN - (time.monotonic() - start)
+
+    def wait_exit():
+        try:
+            wait_pid(args.pid, max(remaining(), 0))
+        except TimeoutError:
+            return 'timed out'
+        return 'exited'
+
+    print("Shutting down Bamboo...", flush=True)
+    if args.pid is None:
+        print("Bamboo JVM not found; nothing to shut down", flush=True)
+    elif setup_complete():
+        phase('drain', drain, os.environ.get('ATL_SHUTDOWN_DRAIN_TOKEN'), remaining() - args.stop_budget)
+        # A stop that overruns the budget moves on; the JVM is killed if it has not exited in time
+        phase('stop', stop_tomcat, args.pid, max(remaining(), 1))
+        phase('exit', wait_exit)
+        if phases[-1]['result'] != 'exited':
+            phase('kill', kill_jvm, args.pid)
+    else:
+        # Setup has not been completed; there is nothing to drain or persist
+        phase('stop', stop_tomcat, args.pid, max(remaining(), 1))
+        try:
+            os.kill(1, signal.SIGTERM)
+        except PermissionError:
+            pass
+
+    report = {
+        'grace_period': args.grace_period,
+        'total_seconds': round(time.monotonic() - start, 3),
+        'phases': phases,
+    }
+    print(json.dumps(report), flush=True)
+    return 0 if not phases or phases[-1]['result'] in ('exited', 'stopped') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
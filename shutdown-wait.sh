@@ -7,10 +7,11 @@
 # primarily intended for use in environments that provide an orderly
 # shutdown mechanism, in particular the Kubernetes `preStop` hook.
 #
-# This script will wait for the process to exit indefinitely; however
-# most run-time tools (including Docker and Kubernetes) have their own
-# shutdown timeouts that will send a SIGKILL if the grace period is
-# exceeded.
+# Running builds are drained first if ATL_SHUTDOWN_DRAIN_TOKEN is set.
+# Each phase is bounded by ATL_SHUTDOWN_GRACE_PERIOD, which should match
+# the pod's `terminationGracePeriodSeconds`; see shutdown-orchestrator.py.
+# Most run-time tools (including Docker and Kubernetes) will send a
+# SIGKILL if the grace period is exceeded.
 #
 ##############################################################################
 
@@ -18,18 +19,4 @@ set -e
 
 source /opt/atlassian/support/common.sh
 
-echo "Shutting down Bamboo..."
-echo ${JVM_APP_PID} > ${BAMBOO_INSTALL_DIR}/work/catalina.pid
-export CATALINA_PID="${BAMBOO_INSTALL_DIR}/work/catalina.pid"
-if [[ "${UID}" == 0 ]]; then
-    /bin/su ${RUN_USER} -c ${BAMBOO_INSTALL_DIR}/bin/stop-bamboo.sh;
-else
-    ${BAMBOO_INSTALL_DIR}/bin/stop-bamboo.sh;
-fi
-
-SETUP_TYPE=$(cat ${BAMBOO_HOME}/bamboo.cfg.xml | grep setupType)
-if [[ ${SETUP_TYPE} != *"complete"* ]]; then
-  kill 1
-else
-/opt/atlassian/support/wait-pid.sh ${JVM_APP_PID}
-fi
+exec /shutdown-orchestrator.py ${JVM_APP_PID}
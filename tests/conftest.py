@@ -1,3 +1,3 @@
 import pytest
 
-from fixtures import docker_cli, image, run_user
+from fixtures import container_pool, docker_cli, image, run_user
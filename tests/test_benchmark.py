@@ -0,0 +1,32 @@
+# Container startup benchmark. Skipped unless BENCHMARK_REPETITIONS is set, e.g.:
+#
+#     BENCHMARK_REPETITIONS=5 BENCHMARK_BASELINE=baseline.json py.test -v tests/test_benchmark.py
+#
+# The results are written to BENCHMARK_RESULTS (default: benchmark-startup.json), which can be kept as the
+# baseline for later runs. With a baseline, the test fails if the median time to a RUNNING status regresses
+# by more than BENCHMARK_THRESHOLD (default: 0.2, i.e. 20%).
+
+import os
+import pytest
+
+from benchmark import find_regressions, format_results, load_results, run_benchmark, save_results
+
+PORT = 8085
+
+REPETITIONS = int(os.environ.get('BENCHMARK_REPETITIONS') or 0)
+RESULTS = os.environ.get('BENCHMARK_RESULTS') or 'benchmark-startup.json'
+BASELINE = os.environ.get('BENCHMARK_BASELINE')
+THRESHOLD = float(os.environ.get('BENCHMARK_THRESHOLD') or 0.2)
+
+
+@pytest.mark.skipif(not REPETITIONS, reason='BENCHMARK_REPETITIONS is not set')
+def test_startup_benchmark(docker_cli, image):
+    results = run_benchmark(docker_cli, image, PORT, repetitions=REPETITIONS)
+    save_results(results, RESULTS)
+
+    baseline = load_results(BASELINE) if BASELINE else None
+    print(format_results(results, baseline))
+
+    assert results['median']['status_running'] is not None
+    if baseline is not None:
+        assert find_regressions(results, baseline, THRESHOLD) == []
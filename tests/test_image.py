@@ -1,15 +1,16 @@
+import json
 import pytest
 import signal
 import testinfra
-import xml.sax.saxutils as saxutils
 import re
+import requests
 from helpers import get_app_home, get_app_install_dir, get_bootstrap_proc, get_procs, \
-    parse_properties, parse_xml, run_image, wait_for_http_response, wait_for_proc, wait_for_log
+    parse_properties, parse_xml, run_image, status_url, wait_for_http_response, wait_for_proc, wait_for_log, \
+    wait_for_file
 
 from iterators import TimeoutIterator
 
 PORT = 8085
-STATUS_URL = f'http://localhost:{PORT}/status'
 
 
 def test_jvm_args(docker_cli, image, run_user):
@@ -30,8 +31,95 @@ def test_jvm_args(docker_cli, image, run_user):
     assert environment.get('JVM_SUPPORT_RECOMMENDED_ARGS') in jvm
 
 
-def test_install_permissions(docker_cli, image):
-    container = run_image(docker_cli, image)
+def test_gc_log(docker_cli, image, run_user):
+    environment = {
+        'ATL_GC_LOG': 'true',
+        'ATL_GC_LOG_FILECOUNT': '5',
+        'ATL_GC_LOG_FILESIZE': '10M',
+    }
+    container = run_image(docker_cli, image, user=run_user, environment=environment)
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    gc_log = f'{get_app_install_dir(container)}/logs/gc.log'
+    assert f'-Xlog:gc*,safepoint:file={gc_log}:time,uptime,level,tags:filecount=5,filesize=10M' in jvm
+
+    wait_for_file(container, gc_log)
+    stats = container.run(f'/opt/atlassian/support/gc_stats.py --total {gc_log}')
+    assert stats.rc == 0
+
+
+def test_jfr_continuous(docker_cli, image, run_user):
+    environment = {
+        'ATL_JFR_MODE': 'continuous',
+        'ATL_JFR_MAXAGE': '1h',
+        'ATL_JFR_MAXSIZE': '100m',
+    }
+    container = run_image(docker_cli, image, user=run_user, environment=environment)
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    jfr_dir = f'{get_app_install_dir(container)}/logs/jfr'
+    assert f'-XX:FlightRecorderOptions=repository={jfr_dir}' in jvm
+    assert '-XX:StartFlightRecording=name=atlassian,settings=default,disk=true,maxage=1h,maxsize=100m' in jvm
+
+    container.run('/opt/atlassian/support/jfr-dump.sh')
+    recordings = container.run(f'find {get_app_home(container)}/jfr -name "*.jfr"').stdout.splitlines()
+    assert len(recordings) == 1
+
+
+def test_jmx_metrics(docker_cli, image, run_user):
+    environment = {'ATL_METRICS_PORT': '9404'}
+    container = docker_cli.containers.run(image, detach=True, user=run_user, environment=environment,
+                                          ports={PORT: None, 9404: None})
+    wait_for_http_response(status_url(container), expected_status=200)
+    host = testinfra.get_host("docker://" + container.id)
+    jvm = wait_for_proc(host, get_bootstrap_proc(host))
+
+    config = f'{get_app_home(host)}/jmx-exporter.yml'
+    assert f'-javaagent:/opt/atlassian/jmx/jmx_prometheus_javaagent.jar=9404:{config}' in jvm
+
+    metrics = requests.get(status_url(container, 9404, '/metrics')).text
+    assert re.search(r'^tomcat_threadpool_currentthreadsbusy\{connector="http-nio-8085",?\} \d', metrics, re.MULTILINE)
+    assert 'jvm_memory_used_bytes{area="heap"' in metrics
+
+
+def test_jfr_off_by_default(container_pool, image):
+    container = container_pool.get(image)
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    assert 'StartFlightRecording' not in jvm
+
+
+def test_appcds_archive(container_pool, image):
+    container = container_pool.get(image)
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    archive = f'{get_app_install_dir(container)}/appcds/bamboo.jsa'
+    if not container.file(archive).exists:
+        pytest.skip('No AppCDS archive in this image (JDK < 13 or APPCDS=false)')
+    assert f'-XX:SharedArchiveFile={archive}' in jvm
+
+
+def test_jar_scan_filter(container_pool, image):
+    container = container_pool.get(image)
+    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    skip_lists = json.loads(container.file(f'{get_app_install_dir(container)}/conf/jarscan.json').content_string)
+    assert skip_lists['tldSkip']
+
+    xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
+    tld_skip = xml.find('.//Context/JarScanner/JarScanFilter').get('tldSkip').split(',')
+    assert tld_skip[1:] == skip_lists['tldSkip']
+
+
+def test_appcds_disabled(docker_cli, image):
+    container = run_image(docker_cli, image, environment={'ATL_APPCDS': 'false'})
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    assert 'SharedArchiveFile' not in jvm
+
+
+def test_install_permissions(container_pool, image):
+    container = container_pool.get(image)
 
     assert container.file(f'{get_app_install_dir(container)}/conf/server.xml').user == 'root'
 
@@ -45,16 +133,16 @@ def test_install_permissions(docker_cli, image):
 
 
 def test_first_run_state(docker_cli, image, run_user):
-    container = run_image(docker_cli, image, user=run_user, ports={PORT: PORT})
+    container = run_image(docker_cli, image, user=run_user, ports={PORT: None})
 
-    wait_for_http_response(STATUS_URL, expected_status=200)
+    wait_for_http_response(status_url(container), expected_status=200)
 
 
 def test_clean_shutdown(docker_cli, image, run_user):
-    container = docker_cli.containers.run(image, detach=True, user=run_user, ports={PORT: PORT})
+    container = docker_cli.containers.run(image, detach=True, user=run_user, ports={PORT: None})
     host = testinfra.get_host("docker://" + container.id)
 
-    wait_for_http_response(STATUS_URL, expected_status=200)
+    wait_for_http_response(status_url(container), expected_status=200)
 
     container.kill(signal.SIGTERM)
 
@@ -63,10 +151,10 @@ def test_clean_shutdown(docker_cli, image, run_user):
 
 
 def test_shutdown_script(docker_cli, image, run_user):
-    container = docker_cli.containers.run(image, detach=True, user=run_user, ports={PORT: PORT})
+    container = docker_cli.containers.run(image, detach=True, user=run_user, ports={PORT: None})
     host = testinfra.get_host("docker://" + container.id)
 
-    wait_for_http_response(STATUS_URL, expected_status=200)
+    wait_for_http_response(status_url(container), expected_status=200)
 
     container.exec_run('/shutdown-wait.sh')
 
@@ -74,8 +162,25 @@ def test_shutdown_script(docker_cli, image, run_user):
     wait_for_log(container, end)
 
 
-def test_server_xml_defaults(docker_cli, image):
-    container = run_image(docker_cli, image)
+def test_shutdown_script_timings(docker_cli, image, run_user):
+    environment = {
+        'ATL_SHUTDOWN_GRACE_PERIOD': '60',
+    }
+    container = docker_cli.containers.run(image, detach=True, user=run_user, environment=environment,
+                                          ports={PORT: None})
+
+    wait_for_http_response(status_url(container), expected_status=200)
+
+    result = container.exec_run('/shutdown-wait.sh')
+    report = json.loads(result.output.decode().strip().splitlines()[-1])
+
+    assert report['grace_period'] == 60
+    assert report['total_seconds'] < 60
+    assert [p['phase'] for p in report['phases']][0] in ('drain', 'stop')
+
+
+def test_server_xml_defaults(container_pool, image):
+    container = container_pool.get(image)
     _jvm = wait_for_proc(container, get_bootstrap_proc(container))
 
     xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
@@ -98,6 +203,25 @@ def test_server_xml_defaults(docker_cli, image):
     assert context.get('path') == ''
     assert valve.get('maxDays') == '-1'
 
+def test_scratch_dir(docker_cli, image, run_user):
+    environment = {
+        'ATL_SCRATCH_DIR': '/scratch',
+    }
+    container = run_image(docker_cli, image, user=run_user, environment=environment,
+                          tmpfs={'/scratch': 'mode=1777'})
+    jvm = wait_for_proc(container, get_bootstrap_proc(container))
+
+    assert '-Djava.io.tmpdir=/scratch/tomcat-temp' in jvm
+
+    xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
+    assert xml.find('.//Host').get('workDir') == '/scratch/tomcat-work'
+
+    for d in ['temp', 'local-working-dir', 'caches']:
+        link = container.file(f'{get_app_home(container)}/{d}')
+        assert link.is_symlink
+        assert link.linked_to == f'/scratch/home/{d}'
+
+
 def test_server_xml_catalina_fallback(docker_cli, image):
     environment = {
         'CATALINA_CONNECTOR_PROXYNAME': 'PROXYNAME',
@@ -120,51 +244,12 @@ def test_server_xml_catalina_fallback(docker_cli, image):
     assert context.get('path') == 'CONTEXT'
 
 
+# Template rendering is covered by tests/unit/test_templates.py; this checks that the
+# environment reaches server.xml in the running image
 def test_server_xml_params(docker_cli, image):
     environment = {
-        'ATL_TOMCAT_MGMT_PORT': '8008',
         'ATL_TOMCAT_PORT': '9095',
-        'ATL_TOMCAT_MAXTHREADS': '151',
-        'ATL_TOMCAT_MINSPARETHREADS': '26',
-        'ATL_TOMCAT_CONNECTIONTIMEOUT': '20001',
-        'ATL_TOMCAT_ENABLELOOKUPS': 'true',
-        'ATL_TOMCAT_PROTOCOL': 'HTTP/1.1',
-        'ATL_TOMCAT_ACCEPTCOUNT': '101',
-        'ATL_TOMCAT_SECURE': 'true',
-        'ATL_TOMCAT_SCHEME': 'https',
-        'ATL_PROXY_NAME': 'bamboo.atlassian.com',
-        'ATL_PROXY_PORT': '443',
         'ATL_TOMCAT_CONTEXTPATH': '/mybamboo',
-        'ATL_TOMCAT_ACCESS_LOGS_MAXDAYS': '10',
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
-    connector = xml.find('.//Connector')
-    context = xml.find('.//Context')
-    valve = xml.find('.//Valve[@className="org.apache.catalina.valves.AccessLogValve"]')
-
-    assert xml.get('port') == environment.get('ATL_TOMCAT_MGMT_PORT')
-
-    assert connector.get('port') == environment.get('ATL_TOMCAT_PORT')
-    assert connector.get('maxThreads') == environment.get('ATL_TOMCAT_MAXTHREADS')
-    assert connector.get('minSpareThreads') == environment.get('ATL_TOMCAT_MINSPARETHREADS')
-    assert connector.get('connectionTimeout') == environment.get('ATL_TOMCAT_CONNECTIONTIMEOUT')
-    assert connector.get('enableLookups') == environment.get('ATL_TOMCAT_ENABLELOOKUPS')
-    assert connector.get('protocol') == environment.get('ATL_TOMCAT_PROTOCOL')
-    assert connector.get('acceptCount') == environment.get('ATL_TOMCAT_ACCEPTCOUNT')
-    assert connector.get('secure') == environment.get('ATL_TOMCAT_SECURE')
-    assert connector.get('scheme') == environment.get('ATL_TOMCAT_SCHEME')
-    assert connector.get('proxyName') == environment.get('ATL_PROXY_NAME')
-    assert connector.get('proxyPort') == environment.get('ATL_PROXY_PORT')
-
-    assert context.get('path') == environment.get('ATL_TOMCAT_CONTEXTPATH')
-    
-    assert valve.get('maxDays') == environment.get('ATL_TOMCAT_ACCESS_LOGS_MAXDAYS')
-
-def test_server_xml_params_compression_on_default(docker_cli, image):
-    environment = {
         'ATL_TOMCAT_COMPRESSION': 'on',
     }
     container = run_image(docker_cli, image, environment=environment)
@@ -173,39 +258,9 @@ def test_server_xml_params_compression_on_default(docker_cli, image):
     xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
     connector = xml.find('.//Connector')
 
+    assert connector.get('port') == environment.get('ATL_TOMCAT_PORT')
     assert connector.get('compression') == environment.get('ATL_TOMCAT_COMPRESSION')
-    assert connector.get('compressibleMimeType') == 'text/html,text/xml,text/plain,text/css,text/javascript,application/javascript,application/json,application/xml'
-    assert connector.get('compressionMinSize') == '2048'
-
-def test_server_xml_params_compression_on_custom(docker_cli, image):
-    environment = {
-        'ATL_TOMCAT_COMPRESSION': 'on',
-        'ATL_TOMCAT_COMPRESSIBLEMIMETYPE': 'text/html,text/xml',
-        'ATL_TOMCAT_COMPRESSIONMINSIZE': '4096',
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
-    connector = xml.find('.//Connector')
-
-    assert connector.get('compression') == environment.get('ATL_TOMCAT_COMPRESSION')
-    assert connector.get('compressibleMimeType') == 'text/html,text/xml'
-    assert connector.get('compressionMinSize') == '4096'
-
-def test_server_xml_params_compression_off(docker_cli, image):
-    environment = {
-        'ATL_TOMCAT_COMPRESSION': 'off',
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    xml = parse_xml(container, f'{get_app_install_dir(container)}/conf/server.xml')
-    connector = xml.find('.//Connector')
-
-    assert connector.get('compression') is None
-    assert connector.get('compressibleMimeType') is None
-    assert connector.get('compressionMinSize') is None
+    assert xml.find('.//Context').get('path') == environment.get('ATL_TOMCAT_CONTEXTPATH')
 
 def test_pre_seed_file(docker_cli, image, run_user):
     environment = {
@@ -242,7 +297,7 @@ def test_pre_seed_file(docker_cli, image, run_user):
     assert props.contains('bamboo.admin.password=adminpass')
     assert props.contains('bamboo.admin.email=admin@atlassian.com')
 
-def test_pre_seed_file_broker_uri_nio(docker_cli, image, run_user):
+def test_pre_seed_file_broker_uri(docker_cli, image, run_user):
     environment = {
         'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
         'BAMBOO_VERSION': '9.1.2'
@@ -254,79 +309,25 @@ def test_pre_seed_file_broker_uri_nio(docker_cli, image, run_user):
 
     assert props.contains("bamboo.broker.uri=nio://0.0.0.0:54663")
 
-def test_pre_seed_file_broker_uri_ssl_two_three(docker_cli, image, run_user):
-    environment = {
-        'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
-        'BAMBOO_VERSION': '9.2.3'
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    props = container.file(f'{get_app_home(container)}/unattended-setup.properties')
-
-    assert props.contains("bamboo.broker.uri=ssl://0.0.0.0:54663")
-
-def test_pre_seed_file_broker_uri_ssl_three_one(docker_cli, image, run_user):
-    environment = {
-        'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
-        'BAMBOO_VERSION': '9.3.1'
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    props = container.file(f'{get_app_home(container)}/unattended-setup.properties')
-
-    assert props.contains("bamboo.broker.uri=ssl://0.0.0.0:54663")
 
-def test_pre_seed_file_broker_uri_ssl_three_one_plus(docker_cli, image, run_user):
+def test_db_wait(docker_cli, image):
     environment = {
-        'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
-        'BAMBOO_VERSION': '9.3.3'
+        'ATL_JDBC_URL': 'jdbc:postgresql://localhost:5999/bamboodocker',
+        'ATL_DB_WAIT': 'true',
+        'ATL_DB_WAIT_DEADLINE': '3',
     }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    props = container.file(f'{get_app_home(container)}/unattended-setup.properties')
-
-    assert props.contains("bamboo.broker.uri=ssl://0.0.0.0:54663")
-
-def test_pre_seed_file_broker_uri_ssl_version_ten(docker_cli, image, run_user):
-    environment = {
-        'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
-        'BAMBOO_VERSION': '10.0.0'
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    props = container.file(f'{get_app_home(container)}/unattended-setup.properties')
-
-    assert props.contains("bamboo.broker.uri=ssl://0.0.0.0:54663")
-
+    container = docker_cli.containers.run(image, detach=True, environment=environment)
 
-def test_pre_seed_file_broker_uri_ssl_snap_rc(docker_cli, image, run_user):
-    environment = {
-        'ATL_BAMBOO_ENABLE_UNATTENDED_SETUP': 'True',
-        'BAMBOO_VERSION': '11.0.0-rc1'
-    }
-    container = run_image(docker_cli, image, environment=environment)
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-
-    props = container.file(f'{get_app_home(container)}/unattended-setup.properties')
-
-    assert props.contains("bamboo.broker.uri=ssl://0.0.0.0:54663")
+    wait_for_log(container, r'Database database \(localhost:5999\) not ready after [0-9.]+s')
+    host = testinfra.get_host("docker://" + container.id)
+    _jvm = wait_for_proc(host, get_bootstrap_proc(host))
 
 
 def test_bamboo_cfg_xml(docker_cli, image):
     environment = {
         'BUILD_NUMBER': '61009',
         'ATL_JDBC_URL': 'jdbc:postgresql://172.17.0.2:5432/bamboodocker',
-        'ATL_BROKER_CLIENT_URI': 'failover:(tcp://fa802b2849c3:54664?wireFormat.maxInactivityDuration=300000)?maxReconnectAttempts=10&amp;initialReconnectDelay=15000',
-        'ATL_BROKER_URI': 'nio://0.0.0.0:54664',
-        'ATL_DB_POOLMINSIZE': '4',
         'ATL_DB_POOLMAXSIZE': '400',
-        'ATL_DB_TIMEOUT': '40',
-        'ATL_DB_CONNECTIONTIMEOUT': '60',
-        'ATL_DB_LEAKDETECTION': '20'
     }
     container = run_image(docker_cli, image, environment=environment)
     _jvm = wait_for_proc(container, get_bootstrap_proc(container))
@@ -334,18 +335,8 @@ def test_bamboo_cfg_xml(docker_cli, image):
     xml = parse_xml(container, f'{get_app_home(container)}/bamboo.cfg.xml')
 
     assert xml.find(".//buildNumber").text == environment.get('BUILD_NUMBER')
-    assert saxutils.escape(xml.find(".//property[@name='bamboo.jms.broker.client.uri']").text) == environment.get(
-        'ATL_BROKER_CLIENT_URI')
-    assert xml.find(".//property[@name='bamboo.jms.broker.uri']").text == environment.get('ATL_BROKER_URI')
     assert xml.find(".//property[@name='hibernate.hikari.maximumPoolSize']").text == environment.get(
         'ATL_DB_POOLMAXSIZE')
-    assert xml.find(".//property[@name='hibernate.hikari.minimumIdle']").text == environment.get('ATL_DB_POOLMINSIZE')
-    assert xml.find(".//property[@name='hibernate.hikari.idleTimeout']").text == str(
-        int(environment.get('ATL_DB_TIMEOUT')) * 1000)
-    assert xml.find(".//property[@name='hibernate.hikari.connectionTimeout']").text == str(
-        int(environment.get('ATL_DB_CONNECTIONTIMEOUT')) * 1000)
-    assert xml.find(".//property[@name='hibernate.hikari.leakDetectionThreshold']").text == str(
-        int(environment.get('ATL_DB_LEAKDETECTION')) * 1000)
 
 
 def test_skip_bamboo_cfg_xml(docker_cli, image):
@@ -365,8 +356,8 @@ def test_skip_bamboo_cfg_xml(docker_cli, image):
     assert not container.file(f'{get_app_home(container)}/bamboo.cfg.xml').exists
 
 
-def test_seraph_defaults(docker_cli, image):
-    container = run_image(docker_cli, image)
+def test_seraph_defaults(container_pool, image):
+    container = container_pool.get(image)
     _jvm = wait_for_proc(container, get_bootstrap_proc(container))
 
     xml = parse_xml(container, f'{get_app_install_dir(container)}/atlassian-bamboo/WEB-INF/classes/seraph-config.xml')
@@ -381,20 +372,6 @@ def test_seraph_login_set(docker_cli, image):
     xml = parse_xml(container, f'{get_app_install_dir(container)}/atlassian-bamboo/WEB-INF/classes/seraph-config.xml')
     assert xml.findall('.//param-value[.="TEST_VAL"]')[0].text == "TEST_VAL"
 
-@pytest.mark.parametrize("bamboo_version,expected_login_url", [
-    ("9.6.4", '/userlogin!doDefault.action?os_destination=${originalurl}'), # Bamboo <= 9
-    ("10.0.1", '/userlogin.action?os_destination=${originalurl}'),          # Bamboo >= 10
-])
-def test_seraph_login_url_per_bamboo_version(docker_cli, image, bamboo_version, expected_login_url):
-    container = run_image(docker_cli, image, environment={"BAMBOO_VERSION": bamboo_version})
-    _jvm = wait_for_proc(container, get_bootstrap_proc(container))
-    xml = parse_xml(container, f'{get_app_install_dir(container)}/atlassian-bamboo/WEB-INF/classes/seraph-config.xml')
-    # Find the <param-value> element that should contain the login_url.
-    login_url_element = xml.find(".//init-param[param-name='login.url']/param-value")
-    assert login_url_element is not None, "login.url param-value element not found"
-    assert login_url_element.text == expected_login_url, (f"Expected login.url to be '{expected_login_url}' for Bamboo {bamboo_version}, "
-                                                          f"but found '{login_url_element.text if login_url_element is not None else 'None'}'")
-
 def test_bamboo_init_set(docker_cli, image):
     container = run_image(docker_cli, image, environment={'BAMBOO_HOME': '/tmp/'})
     _jvm = wait_for_proc(container, get_bootstrap_proc(container))
@@ -403,9 +380,9 @@ def test_bamboo_init_set(docker_cli, image):
     assert init.contains("bamboo.home = /tmp/")
 
 
-def test_java_in_run_user_path(docker_cli, image):
+def test_java_in_run_user_path(container_pool, image):
     RUN_USER = 'bamboo'
-    container = run_image(docker_cli, image)
+    container = container_pool.get(image)
     proc = container.run(f'su -c "which java" {RUN_USER}')
     assert len(proc.stdout) > 0
 
@@ -496,8 +473,8 @@ def test_pre_seed_file_overwrite(docker_cli, image, run_user):
     props = tihost.file(cfg)
     assert props.contains('db.user=dbuser')
 
-def test_git(docker_cli, image, run_user):
-    container = run_image(docker_cli, image, user=run_user)
+def test_git(container_pool, image, run_user):
+    container = container_pool.get(image, user=run_user)
     container.run_test('git --version')
     container.run_test('git-lfs --version')
     container.run_test('git lfs --version')
@@ -511,8 +488,8 @@ def test_skip_default_allowlist_secure_vars(docker_cli, image, run_user):
         'com_atlassian_db_config_password_ciphers_algorithm_javax_crypto_foor_bar': '/path/to/file'
     }
     container = docker_cli.containers.run(image, detach=True, user=run_user, environment=environment,
-                                          ports={PORT: PORT})
-    wait_for_http_response(STATUS_URL, expected_status=200)
+                                          ports={PORT: None})
+    wait_for_http_response(status_url(container), expected_status=200)
     rpat = re.compile(r'Unsetting environment var (AWS_WEB_IDENTITY_TOKEN_FILE|com_atlassian_db_config_password_ciphers_algorithm_javax_crypto_foor_bar)')
     logs = container.logs(stream=True, follow=True)
     li = TimeoutIterator(logs, timeout=1)
@@ -531,8 +508,8 @@ def test_skip_custom_allowlist_secure_vars(docker_cli, image, run_user):
         'MY_PASS': 'passvalue',
         'ATL_ALLOWLIST_SENSITIVE_ENV_VARS': 'MY_TOKEN, MY_PASS',
     }
-    container = docker_cli.containers.run(image, detach=True, user=run_user, environment=environment, ports={PORT: PORT})
-    wait_for_http_response(STATUS_URL, expected_status=200)
+    container = docker_cli.containers.run(image, detach=True, user=run_user, environment=environment, ports={PORT: None})
+    wait_for_http_response(status_url(container), expected_status=200)
 
     # ensure SECRET env var is unset
     var_unset_log_line_secret = 'Unsetting environment var SECRET'
@@ -0,0 +1,40 @@
+# Connector settings load test. Skipped unless LOADTEST_DURATION is set, e.g.:
+#
+#     LOADTEST_DURATION=30 LOADTEST_CONCURRENCY=100 py.test -v -s tests/test_loadtest.py
+#
+# Each configuration below is started in its own container and loaded with and without keep-alive; the
+# results are printed as a comparison table and written as JSON to LOADTEST_RESULTS (default:
+# loadtest-results.json). LOADTEST_PATHS is a comma-separated list of paths to request, so static resources
+# can be included (default: /status).
+
+import json
+import os
+import pytest
+
+from loadtest import compare_configurations, format_table
+
+PORT = 8085
+
+DURATION = float(os.environ.get('LOADTEST_DURATION') or 0)
+CONCURRENCY = int(os.environ.get('LOADTEST_CONCURRENCY') or 50)
+PATHS = (os.environ.get('LOADTEST_PATHS') or '/status').split(',')
+RESULTS = os.environ.get('LOADTEST_RESULTS') or 'loadtest-results.json'
+
+CONFIGURATIONS = {
+    'default': {},
+    'maxthreads-50': {'ATL_TOMCAT_MAXTHREADS': '50', 'ATL_TOMCAT_ACCEPTCOUNT': '100'},
+    'maxthreads-300': {'ATL_TOMCAT_MAXTHREADS': '300', 'ATL_TOMCAT_ACCEPTCOUNT': '200'},
+    'compression': {'ATL_TOMCAT_COMPRESSION': 'on'},
+    'nio2': {'ATL_TOMCAT_PROTOCOL': 'org.apache.coyote.http11.Http11Nio2Protocol'},
+}
+
+
+@pytest.mark.skipif(not DURATION, reason='LOADTEST_DURATION is not set')
+def test_connector_load(docker_cli, image):
+    rows = compare_configurations(docker_cli, image, PORT, CONFIGURATIONS, PATHS,
+                                  concurrency=CONCURRENCY, duration=DURATION)
+    with open(RESULTS, 'w') as fd:
+        json.dump(rows, fd, indent=2)
+    print(format_table(rows))
+
+    assert all(row['requests'] > 0 for row in rows)
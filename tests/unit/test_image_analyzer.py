@@ -0,0 +1,173 @@
+# Tests for image-analyzer.py against small synthetic `docker save` archives, so that the
+# layer, whiteout and diff handling can be checked without a Docker daemon:
+#
+#     py.test --noconftest tests/unit/
+
+import gzip
+import importlib.util
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+spec = importlib.util.spec_from_file_location('image_analyzer', os.path.join(REPO_DIR, 'image-analyzer.py'))
+analyzer = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(analyzer)
+
+ENV = ['BAMBOO_INSTALL_DIR=/opt/atlassian/bamboo', 'JAVA_HOME=/opt/java/openjdk']
+
+
+def make_tar(entries):
+    """
+    Build an uncompressed tar from (path, content) pairs; a content of None adds a directory.
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for path, content in entries:
+            info = tarfile.TarInfo(path)
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def zstd_compress(data):
+    if analyzer.zstandard is not None:
+        return analyzer.zstandard.ZstdCompressor().compress(data)
+    if shutil.which('zstd') is None:
+        pytest.skip('Neither the zstandard module nor the zstd command is available')
+    return subprocess.run(['zstd', '-c'], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def make_image(path, layers, tags=('atlassian/bamboo:test',)):
+    """
+    Write a legacy `docker save` archive containing the given layers, each a (created_by, layer bytes) pair.
+    """
+    config = {
+        'config': {'Env': ENV},
+        'history': [{'created_by': '/bin/sh -c #(nop)  ENV FOO=bar', 'empty_layer': True}] +
+                   [{'created_by': created_by} for created_by, _ in layers],
+    }
+    manifest = [{'Config': 'config.json', 'RepoTags': list(tags),
+                 'Layers': [f'layer{i}/layer.tar' for i in range(len(layers))]}]
+    members = [('config.json', json.dumps(config).encode()), ('manifest.json', json.dumps(manifest).encode())]
+    members += [(f'layer{i}/layer.tar', data) for i, (_, data) in enumerate(layers)]
+    with tarfile.open(path, mode='w') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+BASE_LAYER = make_tar([
+    ('opt/atlassian/bamboo/', None),
+    ('opt/atlassian/bamboo/lib/a.jar', b'a' * 3000),
+    ('opt/atlassian/bamboo/lib/b.jar', b'b' * 2000),
+    ('opt/java/openjdk/lib/modules', b'm' * 5000),
+    ('var/lib/apt/lists/index', b'i' * 700),
+    ('tmp/build/big.bin', b'x' * 1000),
+    ('tmp/build/sub/small.bin', b'y' * 100),
+    ('tmp/other', b'z' * 10),
+])
+
+
+@pytest.fixture
+def image(tmp_path):
+    layers = [
+        ('/bin/sh -c #(nop) COPY dir:abc in /opt', gzip.compress(BASE_LAYER)),
+        ('RUN /bin/sh -c rm -rf /tmp/build /var/lib/apt/lists/*', make_tar([
+            ('tmp/.wh.build', b''),
+            ('var/lib/apt/lists/.wh..wh..opq', b''),
+        ])),
+        ('RUN /bin/sh -c update', zstd_compress(make_tar([
+            ('opt/atlassian/bamboo/lib/a.jar', b'A' * 3500),
+            ('opt/atlassian/bamboo/lib/copy.jar', b'b' * 2000),
+        ]))),
+    ]
+    return make_image(tmp_path / 'image.tar', layers)
+
+
+def test_layers(image):
+    report = analyzer.analyze(image, hash_min_size=1)
+
+    assert report['tags'] == ['atlassian/bamboo:test']
+    assert [(i['size'], i['files']) for i in report['instructions']] == [(11810, 7), (0, 0), (5500, 2)]
+    assert report['instructions'][0]['created_by'] == 'COPY dir:abc in /opt'
+    assert report['total_size'] == 17310
+    assert report['final_size'] == 3500 + 2000 + 5000 + 10 + 2000
+
+
+def test_whiteouts(image):
+    report = analyzer.analyze(image, hash_min_size=1)
+
+    # /tmp/build (a whiteout of a directory tree) and the contents of /var/lib/apt/lists (an opaque whiteout)
+    assert report['wasted']['deleted'] == 1000 + 100 + 700
+    assert report['wasted']['overwritten'] == 3000
+    assert '/tmp/build' not in report['directories']
+    assert report['directories']['/tmp'] == 10
+    assert 'apt-leftovers' not in report['categories']
+
+
+def test_categories_and_duplicates(image):
+    report = analyzer.analyze(image, hash_min_size=1)
+
+    assert report['categories'] == {'bamboo': 7500, 'jdk': 5000, 'other': 10}
+    assert report['wasted']['duplicate_content'] == 2000
+    assert report['duplicates'][0]['paths'] == ['/opt/atlassian/bamboo/lib/b.jar', '/opt/atlassian/bamboo/lib/copy.jar']
+
+    # Files below the minimum size are not hashed
+    assert analyzer.analyze(image, hash_min_size=4096)['duplicates'] == []
+
+
+def test_overwritten_with_identical_content(tmp_path):
+    path = make_image(tmp_path / 'image.tar', [
+        ('/bin/sh -c #(nop) COPY dir:abc in /opt', BASE_LAYER),
+        ('RUN /bin/sh -c touch', make_tar([('opt/atlassian/bamboo/lib/a.jar', b'a' * 3000)])),
+    ])
+    report = analyzer.analyze(path, hash_min_size=1)
+
+    assert report['wasted']['overwritten'] == 3000
+    assert report['wasted']['duplicate_content'] == 0
+    assert report['duplicates'] == []
+
+
+def test_live_files_delete():
+    live = analyzer.LiveFiles()
+    for path in ['a/b/c', 'a/b/d/e', 'a/bb', 'f']:
+        live.add(path, (0, 1, None))
+
+    assert live.delete('a/b') == 2
+    assert sorted(live.files) == ['a/bb', 'f']
+    assert live.delete('', contents_only=True) == 2
+    assert live.files == {}
+
+
+def test_diff_reports(tmp_path, image):
+    newer = make_image(tmp_path / 'newer.tar', [
+        ('/bin/sh -c #(nop) COPY dir:abc in /opt', BASE_LAYER),
+        ('RUN /bin/sh -c rm -rf /tmp/build /var/lib/apt/lists/*', make_tar([('tmp/.wh.build', b'')])),
+    ])
+    delta = analyzer.diff_reports(analyzer.analyze(image, 1, 3, 0), analyzer.analyze(newer, 1, 3, 0))
+
+    assert delta['total_size'] == -5500
+    assert delta['categories'] == {'bamboo': 5000 - 7500, 'apt-leftovers': 700}
+    assert delta['instructions'] == {'RUN /bin/sh -c update': -5500}
+    assert delta['wasted'] == {'overwritten': -3000, 'deleted': -700, 'duplicate_content': -2000}
+
+
+def test_not_an_image(tmp_path):
+    path = tmp_path / 'layer.tar'
+    path.write_bytes(BASE_LAYER)
+
+    with pytest.raises(ValueError, match='no manifest.json'):
+        analyzer.analyze(str(path))
@@ -0,0 +1,85 @@
+# Tests for the release batch planning in pipelines-generator.py:
+#
+#     py.test --noconftest tests/unit/
+
+import importlib.util
+import os
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+spec = importlib.util.spec_from_file_location('pipelines_generator', os.path.join(REPO_DIR, 'pipelines-generator.py'))
+generator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(generator)
+
+# Build durations in seconds of the versions of one flavour, as recorded by previous releases
+HISTORY = {
+    '9.4.0': 610, '9.4.1': 600, '9.4.3': 620,
+    '9.5.0': 640, '9.5.1': 650,
+    '9.6.4': 700, '9.6.5': 690,
+    '10.0.0': 900, '10.0.1': 880,
+}
+
+
+def flavour(**kwargs):
+    return dict({'start_version': '9.4', 'batches': 16}, **kwargs)
+
+
+def planned_jobs(appdata):
+    return [(start, end) for batch in appdata['plan'] for start, end, _, _ in batch]
+
+
+@pytest.mark.parametrize('version,start,end,expected', [
+    ('9.4.0', '9.4', '', True),
+    ('11.0.1', '9.4', '', True),
+    ('9.3.9', '9.4', '', False),
+    ('9.6.5', '9.4', '10', True),
+    ('10.0.0', '9.4', '10', False),
+])
+def test_in_range(version, start, end, expected):
+    assert generator.in_range(version, start, end) is expected
+
+
+def test_gap_jobs():
+    versions = sorted(HISTORY, key=generator.version_tuple)
+
+    assert generator.gap_jobs(versions, '9.4', '') == [
+        ('9.4.1.1', '9.4.3'),
+        ('9.4.3.1', '9.5.0'),
+        ('9.5.1.1', '9.6.4'),
+        ('9.6.5.1', '10.0.0'),
+        ('10.0.1.1', ''),
+    ]
+    assert generator.gap_jobs(versions, '9.3', '11')[0] == ('9.3', '9.4.0')
+
+
+def test_apply_history_batch_count(capsys):
+    images = {'Bamboo': {17: flavour()}}
+    generator.apply_history(images, {'17': HISTORY}, 8)
+    appdata = images['Bamboo'][17]
+
+    # No two versions fit into the time of the longest build, so each gets a batch; the gap jobs for
+    # versions missing from the history are added to those batches rather than given 5 more
+    assert len(appdata['plan']) == 9
+    jobs = planned_jobs(appdata)
+    assert sorted(j for j in jobs if j[1] == f'{j[0]}.1') == sorted((v, f'{v}.1') for v in HISTORY)
+    assert len(jobs) == len(HISTORY) + 5
+    assert '9 batches for 9 versions and 5 version gaps' in capsys.readouterr().err
+
+
+def test_apply_history_packs_short_builds(capsys):
+    history = {v: d // 2 if generator.version_tuple(v) < (9, 6) else d for v, d in HISTORY.items()}
+    images = {'Bamboo': {17: flavour()}}
+    generator.apply_history(images, {'17': history}, 8)
+
+    # The five 9.4 and 9.5 builds pair up within the time of the longest build
+    assert len(images['Bamboo'][17]['plan']) == 7
+    assert len(planned_jobs(images['Bamboo'][17])) == len(history) + 5
+
+
+def test_apply_history_without_history():
+    images = {'Bamboo': {17: flavour()}}
+    generator.apply_history(images, {'11': HISTORY}, 8)
+
+    assert 'plan' not in images['Bamboo'][17]
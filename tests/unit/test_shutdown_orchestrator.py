@@ -0,0 +1,145 @@
+# In-process tests for shutdown-orchestrator.py, run against a stand-in install directory
+# whose stop-bamboo.sh stops a sleeping process in place of the JVM:
+#
+#     py.test --noconftest tests/unit/
+#
+# Shutting down a real Bamboo is covered by tests/test_image.py.
+
+import http.server
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_DIR, 'shared-components', 'support'))
+
+from wait_pid import pid_exists  # noqa: E402
+
+COMPLETE_CFG = '<application-configuration><setupType>complete</setupType></application-configuration>'
+
+
+@pytest.fixture
+def orchestrator(tmp_path, monkeypatch, capsys):
+    """
+    Returns a function that runs the orchestrator's main() with the given stop-bamboo.sh body and arguments,
+    returning the exit code and the JSON report.
+    """
+    install_dir = tmp_path / 'install'
+    home = tmp_path / 'home'
+    (install_dir / 'bin').mkdir(parents=True)
+    (install_dir / 'work').mkdir()
+    home.mkdir()
+    (home / 'bamboo.cfg.xml').write_text(COMPLETE_CFG)
+    for name, value in (('BAMBOO_INSTALL_DIR', install_dir), ('BAMBOO_HOME', home), ('RUN_USER', 'bamboo')):
+        monkeypatch.setenv(name, str(value))
+    monkeypatch.delenv('ATL_SHUTDOWN_DRAIN_TOKEN', raising=False)
+
+    spec = importlib.util.spec_from_file_location('shutdown_orchestrator',
+                                                  os.path.join(REPO_DIR, 'shutdown-orchestrator.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module.os, 'getuid', lambda: 1000)
+
+    def _run(stop_script, *args):
+        stop = install_dir / 'bin' / 'stop-bamboo.sh'
+        stop.write_text(f'#!/bin/sh\n{stop_script}\n')
+        stop.chmod(0o755)
+        monkeypatch.setattr(sys, 'argv', ['shutdown-orchestrator.py'] + [str(a) for a in args])
+        rc = module.main()
+        lines = capsys.readouterr().out.strip().splitlines()
+        return rc, json.loads(lines[-1]) if lines[-1].startswith('{') else None
+
+    return _run
+
+
+@pytest.fixture
+def jvm():
+    proc = subprocess.Popen(['sleep', '60'])
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+def test_shutdown_phases(orchestrator, jvm):
+    rc, report = orchestrator(f'kill {jvm.pid}', jvm.pid, '--grace-period', '20', '--stop-budget', '10')
+
+    assert rc == 0
+    assert [(p['phase'], p['result']) for p in report['phases']] == [
+        ('drain', 'skipped (ATL_SHUTDOWN_DRAIN_TOKEN not set)'),
+        ('stop', 'stopped'),
+        ('exit', 'exited'),
+    ]
+    assert report['total_seconds'] < 15
+
+
+@pytest.fixture
+def bamboo_server(monkeypatch):
+    """
+    A stand-in for Bamboo's server REST API that is ready for restart once prepareForRestart was POSTed.
+    Returns the list of requests it received.
+    """
+    requests = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def respond(self, state):
+            requests.append((self.command, self.path))
+            body = json.dumps({'state': state}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.respond('READY_FOR_RESTART' if ('POST', '/rest/api/latest/server/prepareForRestart') in requests
+                         else 'RUNNING')
+
+        def do_POST(self):
+            self.respond('PREPARING_FOR_RESTART')
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('localhost', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('ATL_TOMCAT_PORT', str(server.server_address[1]))
+    monkeypatch.setenv('ATL_SHUTDOWN_DRAIN_TOKEN', 'TOKEN')
+    yield requests
+    server.shutdown()
+
+
+def test_shutdown_drain(orchestrator, jvm, bamboo_server):
+    rc, report = orchestrator(f'kill {jvm.pid}', jvm.pid, '--grace-period', '20', '--stop-budget', '10')
+
+    assert rc == 0
+    assert report['phases'][0]['result'] == 'drained (READY_FOR_RESTART)'
+    assert bamboo_server == [('POST', '/rest/api/latest/server/prepareForRestart'),
+                             ('GET', '/rest/api/latest/server')]
+
+
+def test_shutdown_stop_timeout(orchestrator, jvm, tmp_path):
+    # stop-bamboo.sh's children must not outlive the stop phase
+    pidfile = tmp_path / 'stop.pid'
+    rc, report = orchestrator(f'sleep 60 & echo $! > {pidfile}; wait', jvm.pid, '--grace-period', '8',
+                              '--stop-budget', '2')
+
+    assert rc == 1
+    assert [(p['phase'], p['result']) for p in report['phases']] == [
+        ('drain', 'skipped (ATL_SHUTDOWN_DRAIN_TOKEN not set)'),
+        ('stop', 'timed out'),
+        ('exit', 'timed out'),
+        ('kill', 'killed'),
+    ]
+    assert report['total_seconds'] < 8
+    assert not pid_exists(int(pidfile.read_text()))
+
+
+def test_shutdown_without_jvm(orchestrator):
+    rc, report = orchestrator('exit 1')
+
+    assert rc == 0
+    assert report['phases'] == []
@@ -0,0 +1,389 @@
+# In-process rendering tests for the templates in config/. These render the templates
+# with the same Jinja environment and variable handling as the entrypoint, but without
+# building or starting a container, so they run in seconds:
+#
+#     py.test --noconftest tests/unit/
+#
+# Behaviour that depends on the running container (permissions, the JVM command line,
+# startup and shutdown) is covered by tests/test_image.py.
+
+import os
+import sys
+import xml.etree.ElementTree as etree
+from xml.sax import saxutils
+
+import jinja2 as j2
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CONFIG_DIR = os.path.join(REPO_DIR, 'config')
+sys.path.insert(0, os.path.join(REPO_DIR, 'shared-components', 'image'))
+
+import entrypoint_helpers as eh  # noqa: E402
+
+BAMBOO_VERSIONS = ['9.1.2', '9.2.3', '9.3.0', '9.3.1', '9.3.3', '9.4.0', '9.5.0', '9.6.4', '10.0.0', '10.0.1',
+                   '11.0.0-rc1']
+TEMPLATES = sorted(t for t in os.listdir(CONFIG_DIR) if t.endswith('.j2'))
+XML_TEMPLATES = [t for t in TEMPLATES if '.xml' in t]
+
+IMAGE_ENV = {
+    'APP_NAME': 'bamboo',
+    'RUN_USER': 'bamboo',
+    'RUN_GROUP': 'bamboo',
+    'BAMBOO_HOME': '/var/atlassian/application-data/bamboo',
+    'BAMBOO_INSTALL_DIR': '/opt/atlassian/bamboo',
+    'BUILD_NUMBER': '61009',
+}
+
+
+@pytest.fixture
+def render(monkeypatch):
+    """
+    Returns a function that renders a template for the given environment variables, as gen_cfg would.
+    """
+    monkeypatch.setattr(eh, 'jenv', j2.Environment(loader=j2.FileSystemLoader(CONFIG_DIR),
+                                                   autoescape=eh.jenv.autoescape))
+
+    def _render(tmpl, environment=None, bamboo_version='10.0.1'):
+        variables = dict(IMAGE_ENV, BAMBOO_VERSION=bamboo_version, **(environment or {}))
+        # Mirrors the construction of entrypoint_helpers.env
+        env = {k.lower(): eh.escape_ips(v.strip('"'))
+               if k.lower() in ['atl_tomcat_trustedproxies', 'atl_tomcat_internalproxies'] else v
+               for k, v in variables.items()}
+        monkeypatch.setattr(eh, 'env', env)
+        return eh.jenv.get_template(tmpl).render(eh.env)
+
+    return _render
+
+
+def parse_properties(content):
+    lines = [line for line in content.splitlines() if '=' in line and not line.startswith(' ')]
+    return {k.strip(): v.strip() for k, v in (line.split('=', 1) for line in lines)}
+
+
+@pytest.mark.parametrize('bamboo_version', BAMBOO_VERSIONS)
+@pytest.mark.parametrize('tmpl', XML_TEMPLATES)
+def test_xml_well_formed(render, tmpl, bamboo_version):
+    environment = {
+        'ATL_TOMCAT_MGMT_PORT': '8007',
+        'ATL_TOMCAT_BAMBOO_ENCRYPTION_KEY': 'KEY',
+        'ATL_JDBC_URL': 'jdbc:postgresql://db:5432/bamboo',
+        'ATL_AUTOLOGIN_COOKIE_AGE': '100',
+    }
+    etree.fromstring(render(tmpl, environment, bamboo_version))
+
+
+@pytest.mark.parametrize('bamboo_version', BAMBOO_VERSIONS)
+@pytest.mark.parametrize('tmpl', TEMPLATES)
+def test_render_defaults(render, tmpl, bamboo_version):
+    assert render(tmpl, bamboo_version=bamboo_version)
+
+
+def test_server_xml_defaults(render):
+    xml = etree.fromstring(render('server.xml.j2', {'ATL_TOMCAT_MGMT_PORT': '8007'}))
+    connector = xml.find('.//Connector')
+    context = xml.find('.//Context')
+    valve = xml.find('.//Valve[@className="org.apache.catalina.valves.AccessLogValve"]')
+
+    assert connector.get('port') == '8085'
+    assert connector.get('maxThreads') == '150'
+    assert connector.get('minSpareThreads') == '25'
+    assert connector.get('connectionTimeout') == '20000'
+    assert connector.get('enableLookups') == 'false'
+    assert connector.get('protocol') == 'HTTP/1.1'
+    assert connector.get('acceptCount') == '100'
+    assert connector.get('secure') == 'false'
+    assert connector.get('scheme') == 'http'
+    assert connector.get('proxyName') == ''
+    assert connector.get('proxyPort') == ''
+    assert connector.get('compression') is None
+    assert xml.find('.//Valve[@className="org.apache.catalina.valves.RemoteIpValve"]') is None
+
+    assert context.get('path') == ''
+    assert context.find('JarScanner') is None
+    assert valve.get('maxDays') == '-1'
+    assert xml.find('.//Engine').get('startStopThreads') is None
+    assert xml.find('.//Host').get('startStopThreads') is None
+
+
+def test_server_xml_jar_scan_filter(render):
+    environment = {
+        'ATL_TOMCAT_MGMT_PORT': '8007',
+        'ATL_TOMCAT_JARSCAN_TLDSKIP': 'a.jar,b.jar',
+        'ATL_TOMCAT_JARSCAN_PLUGGABILITYSKIP': 'a.jar',
+        'ATL_TOMCAT_STARTSTOPTHREADS': '4',
+    }
+    xml = etree.fromstring(render('server.xml.j2', environment))
+    jar_scan_filter = xml.find('.//Context/JarScanner/JarScanFilter')
+
+    default_skip = '${tomcat.util.scan.StandardJarScanFilter.jarsToSkip}'
+    assert jar_scan_filter.get('tldSkip') == f'{default_skip},a.jar,b.jar'
+    assert jar_scan_filter.get('pluggabilitySkip') == f'{default_skip},a.jar'
+    assert xml.find('.//Engine').get('startStopThreads') == '4'
+    assert xml.find('.//Host').get('startStopThreads') == '4'
+
+
+def test_server_xml_catalina_fallback(render):
+    environment = {
+        'ATL_TOMCAT_MGMT_PORT': '8007',
+        'CATALINA_CONNECTOR_PROXYNAME': 'PROXYNAME',
+        'CATALINA_CONNECTOR_PROXYPORT': 'PROXYPORT',
+        'CATALINA_CONNECTOR_SECURE': 'SECURE',
+        'CATALINA_CONNECTOR_SCHEME': 'SCHEME',
+        'CATALINA_CONTEXT_PATH': 'CONTEXT',
+    }
+    xml = etree.fromstring(render('server.xml.j2', environment))
+    connector = xml.find('.//Connector')
+
+    assert connector.get('proxyName') == 'PROXYNAME'
+    assert connector.get('proxyPort') == 'PROXYPORT'
+    assert connector.get('scheme') == 'SCHEME'
+    assert connector.get('secure') == 'SECURE'
+    assert xml.find('.//Context').get('path') == 'CONTEXT'
+
+
+def test_server_xml_params(render):
+    environment = {
+        'ATL_TOMCAT_MGMT_PORT': '8008',
+        'ATL_TOMCAT_PORT': '9095',
+        'ATL_TOMCAT_MAXTHREADS': '151',
+        'ATL_TOMCAT_MINSPARETHREADS': '26',
+        'ATL_TOMCAT_CONNECTIONTIMEOUT': '20001',
+        'ATL_TOMCAT_ENABLELOOKUPS': 'true',
+        'ATL_TOMCAT_PROTOCOL': 'HTTP/1.1',
+        'ATL_TOMCAT_ACCEPTCOUNT': '101',
+        'ATL_TOMCAT_SECURE': 'true',
+        'ATL_TOMCAT_SCHEME': 'https',
+        'ATL_PROXY_NAME': 'bamboo.atlassian.com',
+        'ATL_PROXY_PORT': '443',
+        'ATL_TOMCAT_CONTEXTPATH': '/mybamboo',
+        'ATL_TOMCAT_ACCESS_LOGS_MAXDAYS': '10',
+    }
+    xml = etree.fromstring(render('server.xml.j2', environment))
+    connector = xml.find('.//Connector')
+
+    assert xml.get('port') == environment.get('ATL_TOMCAT_MGMT_PORT')
+    assert connector.get('port') == environment.get('ATL_TOMCAT_PORT')
+    assert connector.get('maxThreads') == environment.get('ATL_TOMCAT_MAXTHREADS')
+    assert connector.get('minSpareThreads') == environment.get('ATL_TOMCAT_MINSPARETHREADS')
+    assert connector.get('connectionTimeout') == environment.get('ATL_TOMCAT_CONNECTIONTIMEOUT')
+    assert connector.get('enableLookups') == environment.get('ATL_TOMCAT_ENABLELOOKUPS')
+    assert connector.get('protocol') == environment.get('ATL_TOMCAT_PROTOCOL')
+    assert connector.get('acceptCount') == environment.get('ATL_TOMCAT_ACCEPTCOUNT')
+    assert connector.get('secure') == environment.get('ATL_TOMCAT_SECURE')
+    assert connector.get('scheme') == environment.get('ATL_TOMCAT_SCHEME')
+    assert connector.get('proxyName') == environment.get('ATL_PROXY_NAME')
+    assert connector.get('proxyPort') == environment.get('ATL_PROXY_PORT')
+    assert xml.find('.//Context').get('path') == environment.get('ATL_TOMCAT_CONTEXTPATH')
+    valve = xml.find('.//Valve[@className="org.apache.catalina.valves.AccessLogValve"]')
+    assert valve.get('maxDays') == environment.get('ATL_TOMCAT_ACCESS_LOGS_MAXDAYS')
+
+
+@pytest.mark.parametrize('compression,mimetype,minsize,expected', [
+    ('on', None, None, ('on', 'text/html,text/xml,text/plain,text/css,text/javascript,application/javascript,'
+                              'application/json,application/xml', '2048')),
+    ('on', 'text/html,text/xml', '4096', ('on', 'text/html,text/xml', '4096')),
+    ('force', None, '1', ('force', None, '1')),
+    ('2048', None, None, ('2048', None, '2048')),
+    ('off', None, None, (None, None, None)),
+    ('0', None, None, (None, None, None)),
+])
+def test_server_xml_compression(render, compression, mimetype, minsize, expected):
+    environment = {'ATL_TOMCAT_MGMT_PORT': '8007', 'ATL_TOMCAT_COMPRESSION': compression}
+    if mimetype:
+        environment['ATL_TOMCAT_COMPRESSIBLEMIMETYPE'] = mimetype
+    if minsize:
+        environment['ATL_TOMCAT_COMPRESSIONMINSIZE'] = minsize
+    connector = etree.fromstring(render('server.xml.j2', environment)).find('.//Connector')
+
+    assert connector.get('compression') == expected[0]
+    if expected[1] is not None:
+        assert connector.get('compressibleMimeType') == expected[1]
+    assert connector.get('compressionMinSize') == expected[2]
+
+
+@pytest.mark.parametrize('bamboo_version,attribute', [
+    ('9.4.0', 'bambooEncryptionKey'),
+    ('9.5.0', 'productEncryptionKey'),
+    ('10.0.1', 'productEncryptionKey'),
+])
+def test_server_xml_encryption_key_per_bamboo_version(render, bamboo_version, attribute):
+    environment = {'ATL_TOMCAT_MGMT_PORT': '8007', 'ATL_TOMCAT_BAMBOO_ENCRYPTION_KEY': 'KEY'}
+    connector = etree.fromstring(render('server.xml.j2', environment, bamboo_version)).find('.//Connector')
+
+    assert connector.get(attribute) == 'KEY'
+    assert len([a for a in connector.attrib if a.endswith('EncryptionKey')]) == 1
+
+
+def test_server_xml_remote_ip_valve(render):
+    environment = {
+        'ATL_TOMCAT_MGMT_PORT': '8007',
+        'ATL_TOMCAT_TRUSTEDPROXIES': '10.0.0.1|10.0.0.2',
+        'ATL_TOMCAT_INTERNALPROXIES': '"192\\.168\\.0\\.1"',
+    }
+    valve = etree.fromstring(render('server.xml.j2', environment)) \
+        .find('.//Valve[@className="org.apache.catalina.valves.RemoteIpValve"]')
+
+    assert valve.get('trustedProxies') == '10\\.0\\.0\\.1|10\\.0\\.0\\.2'
+    assert valve.get('internalProxies') == '192\\.168\\.0\\.1'
+
+
+@pytest.mark.parametrize('bamboo_version,expected_login_url', [
+    ('9.6.4', '/userlogin!doDefault.action?os_destination=${originalurl}'),  # Bamboo <= 9
+    ('10.0.1', '/userlogin.action?os_destination=${originalurl}'),           # Bamboo >= 10
+])
+def test_seraph_login_url_per_bamboo_version(render, bamboo_version, expected_login_url):
+    xml = etree.fromstring(render('seraph-config.xml.j2', bamboo_version=bamboo_version))
+
+    assert xml.find(".//init-param[param-name='login.url']/param-value").text == expected_login_url
+    assert xml.find(".//init-param[param-name='link.login.url']/param-value").text == expected_login_url
+
+
+def test_seraph_autologin_cookie_age(render):
+    assert etree.fromstring(render('seraph-config.xml.j2')).findall('.//param-name[.="autologin.cookie.age"]') == []
+
+    xml = etree.fromstring(render('seraph-config.xml.j2', {'ATL_AUTOLOGIN_COOKIE_AGE': 'TEST_VAL'}))
+    assert xml.find(".//init-param[param-name='autologin.cookie.age']/param-value").text == 'TEST_VAL'
+
+
+def test_bamboo_cfg_xml(render):
+    environment = {
+        'ATL_JDBC_URL': 'jdbc:postgresql://172.17.0.2:5432/bamboodocker',
+        'ATL_BROKER_CLIENT_URI': 'failover:(tcp://fa802b2849c3:54664?wireFormat.maxInactivityDuration=300000)'
+                                 '?maxReconnectAttempts=10&amp;initialReconnectDelay=15000',
+        'ATL_BROKER_URI': 'nio://0.0.0.0:54664',
+        'ATL_DB_POOLMINSIZE': '4',
+        'ATL_DB_POOLMAXSIZE': '400',
+        'ATL_DB_TIMEOUT': '40',
+        'ATL_DB_CONNECTIONTIMEOUT': '60',
+        'ATL_DB_LEAKDETECTION': '20',
+    }
+    xml = etree.fromstring(render('bamboo.cfg.xml.j2', environment))
+
+    def prop(name):
+        return xml.find(f".//property[@name='{name}']").text
+
+    assert xml.find('.//buildNumber').text == IMAGE_ENV['BUILD_NUMBER']
+    assert xml.find('.//setupType').text == 'initial'
+    assert saxutils.escape(prop('bamboo.jms.broker.client.uri')) == environment['ATL_BROKER_CLIENT_URI']
+    assert prop('bamboo.jms.broker.uri') == environment['ATL_BROKER_URI']
+    assert prop('hibernate.hikari.maximumPoolSize') == '400'
+    assert prop('hibernate.hikari.minimumIdle') == '4'
+    assert prop('hibernate.hikari.idleTimeout') == '40000'
+    assert prop('hibernate.hikari.connectionTimeout') == '60000'
+    assert prop('hibernate.hikari.leakDetectionThreshold') == '20000'
+    assert prop('hibernate.hikari.registerMbeans') == 'true'
+
+
+def test_bamboo_cfg_xml_without_database(render):
+    xml = etree.fromstring(render('bamboo.cfg.xml.j2'))
+
+    assert xml.find(".//property[@name='bamboo.jms.broker.uri']").text == 'nio://0.0.0.0:54663'
+    assert xml.find(".//property[@name='bamboo.jms.broker.client.uri']") is None
+    assert xml.find(".//property[@name='hibernate.hikari.maximumPoolSize']") is None
+
+
+@pytest.mark.parametrize('bamboo_version,expected_broker_uri', [
+    ('9.1.2', 'nio://0.0.0.0:54663'),
+    ('9.2.1', 'nio://0.0.0.0:54663'),
+    ('9.2.3', 'ssl://0.0.0.0:54663'),
+    ('9.3.0', 'nio://0.0.0.0:54663'),
+    ('9.3.1', 'ssl://0.0.0.0:54663'),
+    ('9.3.3', 'ssl://0.0.0.0:54663'),
+    ('10.0.0', 'ssl://0.0.0.0:54663'),
+    ('11.0.0-rc1', 'ssl://0.0.0.0:54663'),
+])
+def test_pre_seed_file_broker_uri(render, bamboo_version, expected_broker_uri):
+    props = parse_properties(render('unattended-setup.properties.j2', bamboo_version=bamboo_version))
+
+    assert props['bamboo.broker.uri'] == expected_broker_uri
+
+
+def test_pre_seed_file(render):
+    environment = {
+        'ATL_DB_TYPE': 'postgresql',
+        'ATL_JDBC_URL': 'jdbc:postgresql://172.17.0.2:5432/bamboodocker',
+        'ATL_JDBC_USER': 'dbuser',
+        'ATL_JDBC_PASSWORD': 'dbpass',
+        'ATL_IMPORT_OPTION': 'import',
+        'ATL_IMPORT_PATH': '/my/import/path',
+        'ATL_LICENSE': 'MYLICENSE',
+        'ATL_ADMIN_USERNAME': 'adminuser',
+        'ATL_ADMIN_PASSWORD': 'adminpass',
+        'ATL_ADMIN_FULLNAME': 'adminname',
+        'ATL_ADMIN_EMAIL': 'admin@atlassian.com',
+        'ATL_BROKER_CLIENT_URI': 'failover:(tcp://broker:54663)',
+    }
+    props = parse_properties(render('unattended-setup.properties.j2', environment))
+
+    assert props['db.type'] == 'postgresql'
+    assert props['db.user'] == 'dbuser'
+    assert props['db.password'] == 'dbpass'
+    assert props['db.url'] == 'jdbc:postgresql://172.17.0.2:5432/bamboodocker'
+    assert props['bamboo.import.option'] == 'import'
+    assert props['bamboo.import.path'] == '/my/import/path'
+    assert props['bamboo.license'] == 'MYLICENSE'
+    assert props['bamboo.admin.username'] == 'adminuser'
+    assert props['bamboo.admin.fullname'] == 'adminname'
+    assert props['bamboo.admin.password'] == 'adminpass'
+    assert props['bamboo.admin.email'] == 'admin@atlassian.com'
+    assert props['bamboo.client.broker.uri'] == 'failover:(tcp://broker:54663)'
+
+
+@pytest.mark.parametrize('bamboo_version,has_legacy_pool_settings', [
+    ('9.3.3', True),
+    ('9.4.0', True),
+    ('9.5.0', False),
+    ('10.0.1', False),
+])
+def test_pre_seed_file_pool_settings_per_bamboo_version(render, bamboo_version, has_legacy_pool_settings):
+    props = parse_properties(render('unattended-setup.properties.j2', bamboo_version=bamboo_version))
+
+    assert ('bamboo.db.connection.timeout' in props) == has_legacy_pool_settings
+    assert ('bamboo.db.leak.connection.threshold' in props) == has_legacy_pool_settings
+
+
+@pytest.mark.parametrize('environment,expected_home', [
+    ({}, IMAGE_ENV['BAMBOO_HOME']),
+    ({'BAMBOO_HOME': '/tmp/'}, '/tmp/'),
+    ({'ATL_PRODUCT_HOME': '/shared/home'}, '/shared/home'),
+])
+def test_bamboo_init(render, environment, expected_home):
+    props = parse_properties(render('bamboo-init.properties.j2', environment))
+
+    assert props['bamboo.home'] == expected_home
+
+
+@pytest.mark.parametrize('db_type,driver,default_url', [
+    ('h2', 'org.h2.Driver', 'jdbc:h2:${bambooHome}/database/h2'),
+    ('mssql', 'com.microsoft.sqlserver.jdbc.SQLServerDriver',
+     'jdbc:sqlserver://localhost:1433;databaseName=<insert_database>'),
+    ('mysql', 'com.mysql.jdbc.Driver', 'jdbc:mysql://localhost/bamboo'),
+    ('oracle', 'oracle.jdbc.OracleDriver', 'jdbc:oracle:thin:@localhost:1521:SID'),
+    ('postgresql', 'org.postgresql.Driver', 'jdbc:postgresql://localhost:5432/bamboo'),
+])
+def test_database_defaults(render, db_type, driver, default_url):
+    props = parse_properties(render(f'{db_type}.properties.j2'))
+    assert props['driverClassName'] == driver
+    assert props['databaseUrl'] == default_url
+    assert props['poolSize'] == '170'
+
+    environment = {'ATL_JDBC_URL': 'jdbc:custom', 'ATL_JDBC_USER': 'dbuser', 'ATL_DB_POOLMAXSIZE': '20'}
+    props = parse_properties(render(f'{db_type}.properties.j2', environment))
+    assert props['databaseUrl'] == 'jdbc:custom'
+    assert props['userName'] == 'dbuser'
+    assert props['poolSize'] == '20'
+
+
+def test_jmx_exporter_rules(render):
+    yaml = pytest.importorskip('yaml')
+    config = yaml.safe_load(render('jmx-exporter.yml.j2', {'ATL_METRICS_START_DELAY': '30'}))
+
+    assert config['startDelaySeconds'] == 30
+    assert config['lowercaseOutputName'] is True
+    names = {rule['name'] for rule in config['rules']}
+    assert {'hikaricp_$2', 'tomcat_threadpool_$2', 'activemq_queue_$3', 'activemq_broker_$2'} <= names
+    for rule in config['rules']:
+        # Every rule must only match MBeans that are queried at all
+        domain = rule['pattern'].split('<', 1)[0]
+        assert any(name.startswith(domain.replace('\\', '') + ':') for name in config['includeObjectNames'])